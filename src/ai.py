@@ -0,0 +1,378 @@
+import math
+import time
+
+from constants import *
+from game import mirror_action, score_lines
+from move_ordering import MoveOrderer
+from parallel import ParallelSearch
+from solver import Solver, describe_outcome
+from tactics import order_tactically, tactical_moves
+from time_manager import CHECK_INTERVAL, TimeManager
+from transposition import EXACT, LOWER, UPPER, TranspositionTable, value_from_table, value_to_table
+
+TIMEOUT_TURN = 2  # Average time of a turn, the time manager spends more or less depending on the position
+TRANSPOSITION_TABLE_SIZE = 1 << 18
+ENDGAME_EMPTY_CELLS = 20  # The exact solver is used below this number of empty cells
+THREAT_ORDERING_MIN_DEPTH = 5  # The threat analysis costs more than it saves close to the leaves
+ASPIRATION_WINDOW = 4  # Half width of the first root window around the previous score, multiplied by 4 on failure
+
+
+def evaluate_game(game, color, depth):
+    if game.winner:
+        if game.winner == DRAW:
+            return 0
+        else:
+            return WIN_SCORE - depth if game.winner['color'] == color else -WIN_SCORE + depth
+    enemy = RED if color == YELLOW else YELLOW
+    if game.incremental_evaluation:
+        return game.scores[color] - game.scores[enemy]
+    return score_lines(game.masks[color]) - score_lines(game.masks[enemy])
+
+
+class AI:
+    def __init__(self, game, color, move_orderer=None, opening_book=None, timeout=TIMEOUT_TURN,
+                 endgame_empty_cells=ENDGAME_EMPTY_CELLS, workers=1, node_limit=math.inf, game_time=None,
+                 position_cache=None, pvs=False, tactics=True,
+                 threat_ordering=False):
+        self.game = game
+        self.color = color
+        self.pvs = pvs  # Principal variation search with aspiration windows instead of plain alpha-beta
+        self.tactics = tactics  # Immediate wins and losses are handled before searching the moves
+        self.threat_ordering = threat_ordering  # With tactics, moves are also ordered by odd/even threat analysis
+        self.time_manager = TimeManager(timeout, game_time)
+        self.node_limit = node_limit
+        self.next_check = 0  # The limits are only checked every CHECK_INTERVAL nodes
+        self.stop_requested = False  # Set from another thread to end the current search
+        self.action = 0, None
+        self.nodes_explored = 0
+        self.max_depth = 1
+        self.iterations = []  # Statistics of every completed iteration of the last search
+        self.listeners = []  # Called with the AI and the statistics at the end of every iteration
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.transposition_table = TranspositionTable(TRANSPOSITION_TABLE_SIZE)
+        self.move_orderer = move_orderer or MoveOrderer()
+        self.opening_book = opening_book
+        self.position_cache = position_cache
+        self.cached_depth = 0  # Depth of the result found in the position cache for the current position
+        self.endgame_empty_cells = endgame_empty_cells
+        self.solver = Solver() if endgame_empty_cells else None
+        self.proven_outcome = None
+        self.parallel_search = ParallelSearch(workers) if workers > 1 else None
+        self.ponder_results = {}  # Canonical key -> (depth, (score, action)) found while the opponent was thinking
+        self.ponder_depth = 0
+        self.pondering = False
+        self.searched_counters = 0, 1  # Nodes explored and max_depth of the last search, kept while pondering
+
+    def cutoff(self, depth):
+        return depth == self.max_depth or self.game.winner
+
+    def evaluate(self, depth):
+        return evaluate_game(self.game, self.color, depth)
+
+    def stop(self):
+        self.stop_requested = True
+        if self.solver is not None:
+            self.solver.stop_requested = True
+
+    def clear_stop(self):
+        self.stop_requested = False
+        if self.solver is not None:
+            self.solver.stop_requested = False
+
+    def limit_reached(self):
+        self.next_check = min(self.nodes_explored + CHECK_INTERVAL, self.node_limit)
+        return self.nodes_explored >= self.node_limit or self.stop_requested or self.time_manager.hard_limit_reached()
+
+    # Minimax with alpha-beta pruning
+    def minimax(self, alpha, beta, depth):
+        if self.nodes_explored >= self.next_check and self.limit_reached():
+            for _ in range(depth):
+                self.game.undo_action()
+            raise TimeoutError
+        self.nodes_explored += 1
+        if self.cutoff(depth):
+            evaluation = self.evaluate(depth)
+            return evaluation, None
+        maximizing = self.game.turn == self.color
+        cells = None
+        if self.tactics:
+            winning_action, cells = tactical_moves(self.game)
+            if winning_action is not None:
+                return (WIN_SCORE - depth - 1 if maximizing else -WIN_SCORE + depth + 1), winning_action
+            if not cells:  # Every move lets the opponent win on the next turn
+                action = self.move_orderer.order(self.game, depth, None)[0]
+                return (-WIN_SCORE + depth + 2 if maximizing else WIN_SCORE - depth - 2), action
+        remaining_depth = self.max_depth - depth
+        key, mirrored = self.game.canonical_key()
+        entry = self.transposition_table.probe(key, mirrored)
+        self.tt_probes += 1
+        entry_action = None
+        if entry is not None:
+            self.tt_hits += 1
+            entry_depth, entry_value, flag, entry_action = entry
+            if entry_depth >= remaining_depth and depth > 0:
+                entry_value = value_from_table(entry_value, depth)
+                if flag == EXACT or (flag == LOWER and entry_value >= beta) or (flag == UPPER and entry_value <= alpha):
+                    return entry_value, entry_action
+        alpha_orig, beta_orig = alpha, beta
+        best_action = None
+        val = -100000 if maximizing else 100000
+        ordered_actions = self.move_orderer.order(self.game, depth, entry_action)
+        if cells is not None:
+            ordered_actions = order_tactically(self.game, ordered_actions, cells,
+                                               self.threat_ordering and remaining_depth >= THREAT_ORDERING_MIN_DEPTH)
+        for i, action in enumerate(ordered_actions):
+            self.game.apply_action(action)
+            if i == 0 or not self.pvs:
+                v, _ = self.minimax(alpha, beta, depth + 1)
+            else:
+                # The first action is expected to be the best, the others only have to be proven worse with a null
+                # window. They are searched again with the full window when they turn out to be better
+                if maximizing:
+                    v, _ = self.minimax(alpha, alpha + 1, depth + 1)
+                else:
+                    v, _ = self.minimax(beta - 1, beta, depth + 1)
+                if alpha < v < beta:
+                    v, _ = self.minimax(alpha, beta, depth + 1)
+            self.game.undo_action()
+            if maximizing:
+                if v > val:
+                    val = v
+                    best_action = action
+                    if v >= beta:
+                        self.record_cutoff(depth, i, action, remaining_depth)
+                        break
+                    alpha = max(alpha, v)
+            else:
+                if v < val:
+                    val = v
+                    best_action = action
+                    if v <= alpha:
+                        self.record_cutoff(depth, i, action, remaining_depth)
+                        break
+                    beta = min(beta, v)
+        if val <= alpha_orig:
+            flag = UPPER
+        elif val >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.transposition_table.store(key, remaining_depth, value_to_table(val, depth), flag, best_action, mirrored)
+        return val, best_action
+
+    def record_cutoff(self, depth, index, action, remaining_depth):
+        self.beta_cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        self.move_orderer.record_cutoff(self.game, depth, action, remaining_depth)
+
+    # Follow the best actions stored in the transposition table from the current position
+    def principal_variation(self):
+        variation = []
+        while len(variation) < self.max_depth and self.game.winner is None:
+            entry = self.transposition_table.probe(*self.game.canonical_key())
+            if entry is None or entry[3] is None:
+                break
+            variation.append(entry[3])
+            self.game.apply_action(entry[3])
+        for _ in variation:
+            self.game.undo_action()
+        return variation
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    # Counters of a single iteration, nodes_explored counts for the whole search
+    def reset_counters(self):
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def end_iteration(self, iteration_start):
+        previous = self.iterations[-1] if self.iterations else None
+        now = time.time()
+        iteration = {
+            'depth': self.max_depth,
+            'score': self.action[0],
+            'action': self.action[1],
+            'nodes': self.nodes_explored - (previous['total_nodes'] if previous else 0),
+            'total_nodes': self.nodes_explored,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'beta_cutoffs': self.beta_cutoffs,
+            'first_move_cutoff_rate': self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else None,
+            'time': now - iteration_start,
+            'elapsed': now - self.time_manager.turn_start_timestamp,
+            'principal_variation': self.principal_variation(),
+        }
+        self.iterations.append(iteration)
+        for listener in self.listeners:
+            listener(self, iteration)
+
+    # Searches every reply of the opponent, deeper and deeper until stop() is called. The results are kept for
+    # get_action, which continues from the depth already reached for the position actually played
+    def ponder(self):
+        self.ponder_results = {}
+        self.ponder_depth = 0
+        if self.game.winner is not None or self.game.turn == self.color:
+            return
+        self.searched_counters = self.nodes_explored, self.max_depth
+        self.pondering = True
+        node_limit = self.node_limit
+        self.node_limit = math.inf
+        self.time_manager.set_deadline(math.inf)
+        self.nodes_explored = 0
+        self.next_check = 0
+        self.transposition_table.new_search()
+        self.move_orderer.new_search()
+        replies = self.move_orderer.order(self.game, 0, None)
+        try:
+            depth = 1
+            while depth <= sum(self.game.cur_depths) + SIZE_X - 1:
+                self.max_depth = depth
+                for reply in replies:
+                    self.game.apply_action(reply)
+                    try:
+                        key, mirrored = self.game.canonical_key()
+                        pondered = self.ponder_results.get(key)
+                        # Replies leading to mirrored positions are only searched once
+                        if self.game.winner is None and (pondered is None or pondered[0] < depth):
+                            score, action = self.minimax(-100000, 100000, 0)
+                            self.ponder_results[key] = depth, (score, mirror_action(action) if mirrored else action)
+                    finally:
+                        self.game.undo_action()
+                self.ponder_depth = depth
+                depth += 1
+        except TimeoutError:
+            pass
+        finally:
+            self.node_limit = node_limit
+            self.nodes_explored, self.max_depth = self.searched_counters
+            self.pondering = False
+
+    # Nodes explored and max_depth of the current search, or of the last one while pondering
+    def search_counters(self):
+        if self.pondering:
+            return self.searched_counters
+        return self.nodes_explored, self.max_depth
+
+    def get_action(self, depth_limit=None):
+        self.time_manager.start_turn(self.game)
+        try:
+            return self.search(depth_limit)
+        finally:
+            self.time_manager.end_turn()
+
+    def search(self, depth_limit):
+        self.nodes_explored = 0
+        self.next_check = 0
+        self.max_depth = 1
+        self.iterations = []
+        self.proven_outcome = None
+        self.cached_depth = 0
+        self.action = 0, None  # The action of the previous turn may not even be legal anymore
+        if self.opening_book is not None:
+            book_action = self.opening_book.lookup(self.game)
+            if book_action is not None:
+                self.action = book_action
+                return self.action[1]
+        empty_cells = sum(self.game.cur_depths) + SIZE_X
+        max_depth = empty_cells  # max_depth shouldn't exceed the number of empty cells left
+        if depth_limit is not None:
+            max_depth = min(max_depth, depth_limit)
+        cached_action = None
+        cached = self.position_cache.lookup(self.game) if self.position_cache is not None else None
+        if cached is not None and cached[2] == EXACT and cached[3] is not None:
+            self.cached_depth, score, _, action = cached
+            cached_action = score if self.game.turn == self.color else -score, action
+            if self.cached_depth >= max_depth:
+                self.action = cached_action
+                if self.cached_depth >= empty_cells:  # Searched until the end of the game
+                    self.proven_outcome = describe_outcome(self.action[0])
+                return self.action[1]
+        if empty_cells < self.endgame_empty_cells:
+            try:
+                # Keep half of the turn for the heuristic search in case the solver doesn't finish in time
+                self.action = self.solver.solve(self.game, max(self.time_manager.soft_deadline - time.time(), 0) / 2)
+                self.nodes_explored = self.solver.nodes_explored
+                self.proven_outcome = describe_outcome(self.action[0])
+                self.store_in_cache(empty_cells)
+                return self.action[1]
+            except TimeoutError:
+                self.nodes_explored = self.solver.nodes_explored  # Use what is left of the turn for the heuristic search
+        if self.parallel_search is not None:
+            action, depth, nodes_explored = self.parallel_search.search(
+                self.game, self.color, self.time_manager.soft_deadline, depth_limit,
+                self.node_limit - self.nodes_explored, lambda: self.stop_requested)
+            self.nodes_explored += nodes_explored
+            if action is not None:
+                self.action = action
+                self.max_depth = depth + 1
+            self.keep_deepest_result(cached_action)
+            self.keep_legal_action()
+            return self.action[1]
+        key, mirrored = self.game.canonical_key()
+        pondered = self.ponder_results.get(key)
+        self.ponder_results = {}
+        if pondered is not None:
+            depth, (score, action) = pondered
+            self.action = score, mirror_action(action) if mirrored else action
+            self.max_depth = depth + 1
+        self.transposition_table.new_search()
+        self.move_orderer.new_search()
+        try:
+            while self.max_depth <= max_depth and self.time_manager.can_start_iteration(self.iterations):
+                iteration_start = time.time()
+                self.reset_counters()
+                self.action = self.search_root()
+                self.end_iteration(iteration_start)
+                self.max_depth += 1
+        except TimeoutError:
+            pass
+        self.keep_deepest_result(cached_action)
+        self.keep_legal_action()
+        return self.action[1]
+
+    # When the turn ended before the first depth was searched, the first action of the move orderer is played
+    def keep_legal_action(self):
+        if self.action[1] is None:
+            self.action = self.evaluate(0), self.move_orderer.order(self.game, 0, None)[0]
+
+    # With pvs, the root window is centered on the previous score and widened while the score falls outside of it
+    def search_root(self):
+        if not self.pvs or self.max_depth == 1 or abs(self.action[0]) > MATE_THRESHOLD:
+            return self.minimax(-100000, 100000, 0)
+        previous = self.action[0]
+        window = ASPIRATION_WINDOW
+        alpha, beta = previous - window, previous + window
+        while True:
+            value, action = self.minimax(alpha, beta, 0)
+            if value <= alpha and alpha > -100000:
+                window *= 4
+                alpha = previous - window if window < WIN_SCORE else -100000
+            elif value >= beta and beta < 100000:
+                window *= 4
+                beta = previous + window if window < WIN_SCORE else 100000
+            else:
+                return value, action
+
+    # The result of the cache is kept when the search didn't go as deep, otherwise the search result is stored
+    def keep_deepest_result(self, cached_action):
+        if cached_action is not None and self.max_depth - 1 <= self.cached_depth:
+            self.action = cached_action
+        else:
+            self.store_in_cache(self.max_depth - 1)
+
+    # The cache stores the score for the player to move, so that both colors and every process can share it
+    def store_in_cache(self, depth):
+        if self.position_cache is None or depth <= self.cached_depth or self.action[1] is None:
+            return
+        score = self.action[0] if self.game.turn == self.color else -self.action[0]
+        self.position_cache.store(self.game, depth, score, EXACT, self.action[1])
@@ -0,0 +1,194 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from ai import AI
+from constants import *
+from game import Game, format_moves, parse_moves
+from game_records import GameRecordWriter, game_result
+from mcts import MCTS
+from move_ordering import MoveOrderer
+from position_cache import PositionCache
+from telemetry import IterationRecorder
+
+# One position cache per path and per process, shared by every game the process plays
+_position_caches = {}
+
+
+# settings are the keyword arguments of AI, plus the MoveOrderer ones under 'move_ordering' and the path of the
+# position cache under 'position_cache'. With 'engine': 'mcts' they are the keyword arguments of MCTS instead, the two
+# minimax options are then ignored
+def create_ai(game, color, settings):
+    settings = dict(settings)
+    engine = settings.pop('engine', 'minimax')
+    move_ordering = settings.pop('move_ordering', None)
+    cache_path = settings.pop('position_cache', None)
+    if engine == 'mcts':
+        return MCTS(game, color, **settings)
+    if engine != 'minimax':
+        raise ValueError(f"Invalid engine ! Engine: {engine}")
+    move_orderer = MoveOrderer(**move_ordering) if move_ordering else None
+    position_cache = None
+    if cache_path:
+        if cache_path not in _position_caches:
+            _position_caches[cache_path] = PositionCache(cache_path)
+        position_cache = _position_caches[cache_path]
+    return AI(game, color, move_orderer=move_orderer, position_cache=position_cache, **settings)
+
+
+def random_opening(rng, n_plies):
+    game = Game()
+    while len(game.actions) < n_plies:
+        actions = sorted(game.successors())
+        rng.shuffle(actions)
+        for action in actions:
+            game.apply_action(action)
+            if game.winner is None:
+                break
+            game.undo_action()
+        else:
+            break  # Every move ends the game, keep the opening shorter
+    return list(game.actions)
+
+
+def play_game(task):
+    index, opening, settings_a, settings_b, collect_telemetry = task
+    # Engines swap colors every game so that both play first equally often
+    engines = {YELLOW: 'a', RED: 'b'} if index % 2 == 0 else {YELLOW: 'b', RED: 'a'}
+    settings = {'a': settings_a, 'b': settings_b}
+    game = Game.from_actions(opening)
+    ais = {color: create_ai(game, color, settings[engine]) for color, engine in engines.items()}
+    recorder = IterationRecorder(game=index)
+    if collect_telemetry:
+        for ai in ais.values():
+            ai.add_listener(recorder)
+    nodes = {'a': 0, 'b': 0}
+    search_time = {'a': 0, 'b': 0}
+    stats = [(0, 0, 0)] * len(opening)  # Score, depth and nodes of every move, the opening isn't searched
+    start = time.time()
+    while game.winner is None:
+        engine = engines[game.turn]
+        ai = ais[game.turn]
+        recorder.context['engine'] = engine
+        recorder.context['ply'] = len(game.actions)
+        move_start = time.time()
+        action = ai.get_action()
+        search_time[engine] += time.time() - move_start
+        nodes[engine] += ai.nodes_explored
+        depth = ai.iterations[-1]['depth'] if ai.iterations else 0
+        stats.append((ai.action[0], depth, ai.nodes_explored))
+        game.apply_action(action)
+    if game.winner == DRAW:
+        winner = 'draw'
+    else:
+        winner = engines[game.winner['color']]
+    return {
+        'game': index,
+        'yellow': engines[YELLOW],
+        'opening': format_moves(opening),
+        'moves': format_moves(game.actions),
+        'winner': winner,
+        'nodes': nodes,
+        'result': game_result(game),
+        'stats': stats,
+        'search_time': search_time,
+        'duration': time.time() - start,
+        'telemetry': recorder.records,
+    }
+
+
+def run(n_games, settings_a, settings_b, workers, opening_plies, seed, output, telemetry=None, records=None):
+    # The games are already played by pool processes, which cannot start the pool of a parallel search
+    for settings in (settings_a, settings_b):
+        if settings.get('workers', 1) > 1:
+            raise ValueError(f"Invalid engine workers ! Workers: {settings['workers']}, use --workers instead")
+    rng = random.Random(seed)
+    tasks = []
+    for index in range(n_games):
+        # Both games of a pair use the same opening with the colors swapped
+        if index % 2 == 0:
+            opening = random_opening(rng, opening_plies)
+        tasks.append((index, opening, settings_a, settings_b, telemetry is not None))
+
+    results = {'a': 0, 'b': 0, 'draw': 0}
+    nodes, search_time = 0, 0
+    # The games end in any order, their records are kept until the previous games are written so that the records
+    # follow the game numbers
+    pending_records = {}
+    next_record = 0
+    start = time.time()
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(play_game, tasks):
+            for record in result.pop('telemetry'):
+                telemetry.write(json.dumps(record) + '\n')
+            result_byte, stats = result.pop('result'), result.pop('stats')
+            if records is not None:
+                pending_records[result['game']] = parse_moves(result['moves']), result_byte, stats
+                while next_record in pending_records:
+                    records.write(*pending_records.pop(next_record))
+                    next_record += 1
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            results[result['winner']] += 1
+            nodes += sum(result['nodes'].values())
+            search_time += sum(result['search_time'].values())
+    duration = time.time() - start
+
+    n_played = sum(results.values())
+    return {
+        'games': n_played,
+        'games_per_second': n_played / duration,
+        'nodes_per_second': nodes / search_time if search_time else 0,
+        'a_wins': results['a'],
+        'draws': results['draw'],
+        'b_wins': results['b'],
+        'a_score': (results['a'] + 0.5 * results['draw']) / n_played if n_played else 0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play AI against AI without the GUI")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--timeout', type=float, default=None, help="Time budget per move in seconds")
+    parser.add_argument('--nodes', type=int, default=None, help="Node budget per move")
+    parser.add_argument('--game-time', type=float, default=None, help="Clock of each engine for the whole game in seconds")
+    parser.add_argument('--opening-plies', type=int, default=4, help="Number of random moves played before the engines")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine-a', type=json.loads, default={}, help="AI settings of engine a as JSON")
+    parser.add_argument('--engine-b', type=json.loads, default={}, help="AI settings of engine b as JSON")
+    parser.add_argument('--output', default=None, help="JSON lines file for the games, stdout by default")
+    parser.add_argument('--telemetry', default=None, help="JSON lines file for the statistics of every iteration")
+    parser.add_argument('--cache', default=None, help="Position cache file shared by both engines and every worker")
+    parser.add_argument('--records', default=None, help="Game records file the games are appended to")
+    args = parser.parse_args()
+
+    budget = {}
+    if args.timeout is not None or args.nodes is not None:
+        budget['timeout'] = math.inf if args.timeout is None else args.timeout
+    if args.nodes is not None:
+        budget['node_limit'] = args.nodes
+    if args.game_time is not None:
+        budget['game_time'] = args.game_time
+    if args.cache is not None:
+        budget['position_cache'] = args.cache
+    settings_a = {**budget, **args.engine_a}
+    settings_b = {**budget, **args.engine_b}
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    telemetry = open(args.telemetry, 'w') if args.telemetry else None
+    records = GameRecordWriter(args.records) if args.records else None
+    summary = run(args.games, settings_a, settings_b, args.workers, args.opening_plies, args.seed, output, telemetry,
+                  records)
+    if records is not None:
+        records.close()
+    if args.output:
+        output.close()
+    if telemetry is not None:
+        telemetry.close()
+    print(json.dumps(summary), file=sys.stderr)
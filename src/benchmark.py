@@ -0,0 +1,151 @@
+import argparse
+import json
+import math
+import sys
+import time
+
+from arena import create_ai
+from game import Game, parse_moves
+from telemetry import JsonLinesLogger
+
+# Name, move string and search depth. The positions come from self-play games at several stages of the game
+BENCHMARK_POSITIONS = (
+    ('empty', '', 10),
+    ('center', '44', 10),
+    ('opening-1', '6447', 10),
+    ('opening-2', '6113', 10),
+    ('early-1', '53515542', 10),
+    ('early-2', '72143324', 10),
+    ('middle-1', '156766577565', 11),
+    ('middle-2', '231454244522', 11),
+    ('late-1', '6262665224334334', 12),
+    ('late-2', '4551443325223545', 12),
+)
+REGRESSION_THRESHOLD = 0.1
+
+
+def run_position(name, moves, depth, node_limit, settings, telemetry=None):
+    game = Game.from_actions(parse_moves(moves))
+    # No opening book nor endgame solver, only the search itself is measured
+    settings = {'timeout': math.inf, 'node_limit': node_limit, **settings}
+    if settings.get('engine', 'minimax') == 'minimax':
+        settings.setdefault('endgame_empty_cells', 0)
+    ai = create_ai(game, game.turn, settings)
+    if telemetry is not None:
+        ai.add_listener(JsonLinesLogger(telemetry, position=name))
+    start = time.time()
+    action = ai.get_action(depth_limit=depth)
+    duration = time.time() - start
+    iterations = ai.iterations
+    if len(iterations) >= 2 and iterations[-2]['nodes']:
+        branching_factor = iterations[-1]['nodes'] / iterations[-2]['nodes']
+    else:
+        branching_factor = None
+    return {
+        'name': name,
+        'moves': moves,
+        'depth': depth,
+        'depth_reached': iterations[-1]['depth'] if iterations else 0,
+        'nodes': ai.nodes_explored,
+        'time': duration,
+        'nodes_per_second': ai.nodes_explored / duration if duration else 0,
+        'time_to_depth': {iteration['depth']: iteration['elapsed'] for iteration in iterations},
+        'nodes_to_depth': {iteration['depth']: iteration['total_nodes'] for iteration in iterations},
+        'effective_branching_factor': branching_factor,
+        'action': action,
+        'score': ai.action[0],
+    }
+
+
+def run(positions, node_limit, settings, depth=None, telemetry=None):
+    results = []
+    for name, moves, position_depth in positions:
+        result = run_position(name, moves, depth or position_depth, node_limit, settings, telemetry)
+        results.append(result)
+        print(f"{name:<12}{result['nodes']:>10} nodes{result['time']:>8.2f}s{result['nodes_per_second']:>10.0f} n/s"
+              f"  depth {result['depth_reached']:<3}move {result['action'] + 1}  score {result['score']}", file=sys.stderr)
+    nodes = sum(result['nodes'] for result in results)
+    duration = sum(result['time'] for result in results)
+    return {
+        'settings': settings,
+        'node_limit': node_limit if node_limit != math.inf else None,
+        'positions': results,
+        'total': {
+            'nodes': nodes,
+            'time': duration,
+            'nodes_per_second': nodes / duration if duration else 0,
+        },
+    }
+
+
+# Lists the differences of new compared to old, a regression is a drop of speed or an increase of the nodes needed
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    depth_nodes = {}  # Depth -> nodes needed by old and new, over the positions where both runs completed the depth
+    old_positions = {result['name']: result for result in old['positions']}
+    for result in new['positions']:
+        old_result = old_positions.get(result['name'])
+        if old_result is None or old_result['moves'] != result['moves'] or old_result['depth'] != result['depth']:
+            continue
+        name = result['name']
+        old_depths = {int(depth): nodes for depth, nodes in old_result.get('nodes_to_depth', {}).items()}
+        for depth, nodes in result.get('nodes_to_depth', {}).items():
+            if int(depth) in old_depths:
+                totals = depth_nodes.setdefault(int(depth), [0, 0])
+                totals[0] += old_depths[int(depth)]
+                totals[1] += nodes
+        if result['nodes_per_second'] < old_result['nodes_per_second'] * (1 - threshold):
+            regressions.append(f"{name}: nodes/s {old_result['nodes_per_second']:.0f} -> {result['nodes_per_second']:.0f}")
+        if result['nodes'] > old_result['nodes'] * (1 + threshold):
+            regressions.append(f"{name}: nodes {old_result['nodes']} -> {result['nodes']}")
+        if result['depth_reached'] < old_result['depth_reached']:
+            regressions.append(f"{name}: depth {old_result['depth_reached']} -> {result['depth_reached']}")
+        if result['action'] != old_result['action'] or result['score'] != old_result['score']:
+            print(f"{name}: move {old_result['action'] + 1} ({old_result['score']}) -> "
+                  f"{result['action'] + 1} ({result['score']})")
+    for depth, (old_nodes, new_nodes) in sorted(depth_nodes.items()):
+        print(f"depth {depth}: nodes {old_nodes} -> {new_nodes} ({(new_nodes / old_nodes - 1) * 100:+.1f}%)")
+    old_speed, new_speed = old['total']['nodes_per_second'], new['total']['nodes_per_second']
+    print(f"total nodes/s: {old_speed:.0f} -> {new_speed:.0f} ({(new_speed / old_speed - 1) * 100:+.1f}%)")
+    print(f"total nodes: {old['total']['nodes']} -> {new['total']['nodes']}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search a fixed set of positions and compare the results of two runs")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--depth', type=int, default=None, help="Overrides the depth of every position")
+    run_parser.add_argument('--nodes', type=int, default=None, help="Node limit of every search")
+    run_parser.add_argument('--engine', type=json.loads, default={}, help="AI settings as JSON")
+    run_parser.add_argument('--position', action='append', default=None, help="Extra position as a move string")
+    run_parser.add_argument('--output', default=None, help="JSON file for the results")
+    run_parser.add_argument('--telemetry', default=None, help="JSON lines file for the statistics of every iteration")
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        positions = list(BENCHMARK_POSITIONS)
+        for moves in args.position or ():
+            positions.append((moves, moves, args.depth or 10))
+        telemetry = open(args.telemetry, 'w') if args.telemetry else None
+        report = run(positions, math.inf if args.nodes is None else args.nodes, args.engine, args.depth, telemetry)
+        if telemetry is not None:
+            telemetry.close()
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+    else:
+        with open(args.old) as f:
+            old_report = json.load(f)
+        with open(args.new) as f:
+            new_report = json.load(f)
+        regressions = compare(old_report, new_report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,132 @@
+import argparse
+import itertools
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from constants import *
+from game import BOARD_MASK, BOTTOM_MASK, COLUMN_BITS, N_CELLS, SHIFTS
+from numpy_bitboards import COLUMN_TOPS, connected_fours
+
+CHUNK_SIZE = 1 << 16  # Number of positions scored at once, bounds the memory used
+
+if np is not None:
+    POPCOUNT_TABLE = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int32)
+    COLUMN_MASKS = np.array([((1 << SIZE_Y) - 1) << (x * COLUMN_BITS) for x in range(SIZE_X)], dtype=np.uint64)
+    LINE_SHIFTS = [(np.uint64(shift), np.uint64(2 * shift), np.uint64(3 * shift)) for shift in SHIFTS]
+
+
+def popcount(bitboards):
+    return POPCOUNT_TABLE[bitboards.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+# Same as game.score_lines on an array of bitboards
+def score_lines(pieces):
+    score = np.zeros(len(pieces), dtype=np.int32)
+    for shift, double_shift, triple_shift in LINE_SHIFTS:
+        starts = pieces & ~(pieces << shift)  # First piece of every line in that direction
+        pairs = starts & (pieces >> shift)
+        triples = pairs & (pieces >> double_shift)
+        score += SCORES_FOR_LINES[2] * popcount(pairs & ~triples)
+        score += SCORES_FOR_LINES[3] * popcount(triples & ~(pieces >> triple_shift))
+    return score
+
+
+# Bitboards of the positions reached by the move strings, in the layout of Game.masks. Returns (yellow, red, valid),
+# a position is not valid when a move string has an unknown column, a move in a full column or a move after the end
+# of the game
+def parse_positions(move_strings):
+    n = len(move_strings)
+    # A character outside ASCII takes several bytes, each of them is an unknown column
+    encoded = [moves.encode() for moves in move_strings]
+    length = max((len(moves) for moves in encoded), default=0)
+    actions = np.full((n, length), -1, dtype=np.int16)
+    for i, moves in enumerate(encoded):
+        actions[i, :len(moves)] = np.frombuffer(moves, dtype=np.uint8) - ord('1')
+    masks = np.zeros((2, n), dtype=np.uint64)  # Yellow then red
+    heights = np.tile(COLUMN_TOPS - SIZE_Y, (n, 1))
+    valid = ((actions < SIZE_X) & (actions >= -1)).all(axis=1)
+    over = np.zeros(n, dtype=bool)
+    rows = np.arange(n)
+    one = np.uint64(1)
+    for ply in range(length):
+        playing = actions[:, ply] >= 0
+        columns = np.where(playing & valid, actions[:, ply], 0)
+        bits = heights[rows, columns]
+        valid &= ~playing | ((bits < COLUMN_TOPS[columns]) & ~over)
+        played = playing & valid
+        pieces = masks[ply % 2]
+        pieces |= np.where(played, one << bits.astype(np.uint64), 0).astype(np.uint64)
+        heights[rows, columns] += played
+        over |= played & connected_fours(pieces)
+    return masks[0], masks[1], valid
+
+
+# Heuristic of AI.evaluate for the player to move of every position, at depth 0, with the winner and the legal moves.
+# yellow and red are arrays of bitboards. Returns a dict of arrays: 'score', 'turn' (the color to move), 'winner'
+# (EMPTY while the game goes on, a color or DRAW), 'legal' (one column per action, all False once the game is over) and
+# 'valid' (the pieces don't overlap, don't float, the numbers of pieces of both colors match and only the player who
+# moved last can have won)
+def score_bitboards(yellow, red):
+    mask = yellow | red
+    n_yellow, n_red = popcount(yellow), popcount(red)
+    turn = np.where(n_yellow == n_red, YELLOW, RED).astype(np.int8)
+    valid = ((yellow & red) == 0) & ((n_yellow == n_red) | (n_yellow == n_red + 1))
+    valid &= (mask & ~(np.uint64(BOARD_MASK))) == 0
+    valid &= (mask & ~((mask << np.uint64(1)) | np.uint64(BOTTOM_MASK))) == 0  # Every piece lies on another one
+    yellow_wins, red_wins = connected_fours(yellow), connected_fours(red)
+    valid &= ~(yellow_wins & red_wins) & ~(yellow_wins & (turn == YELLOW)) & ~(red_wins & (turn == RED))
+    winner = np.full(len(mask), EMPTY, dtype=np.int8)
+    winner[n_yellow + n_red == N_CELLS] = DRAW
+    winner[yellow_wins] = YELLOW
+    winner[red_wins] = RED
+    score = np.where(turn == YELLOW, 1, -1) * (score_lines(yellow) - score_lines(red))
+    score[winner == DRAW] = 0
+    score[(winner == YELLOW) | (winner == RED)] = -WIN_SCORE  # The player to move has lost
+    playable = (mask + np.uint64(BOTTOM_MASK)) & np.uint64(BOARD_MASK)
+    legal = ((playable[:, None] & COLUMN_MASKS) != 0) & (winner == EMPTY)[:, None]
+    return {'score': score, 'turn': turn, 'winner': winner, 'legal': legal, 'valid': valid}
+
+
+# Scores positions chunk by chunk so that the memory stays bounded whatever their number. positions is either an
+# iterable of move strings or an array of shape (n, 2) of yellow and red bitboards. Yields the dict of
+# score_bitboards for every chunk, with 'moves' when the positions are move strings
+def score_positions(positions, chunk_size=CHUNK_SIZE):
+    if np is None:
+        raise ImportError("Bulk scoring requires numpy")
+    if isinstance(positions, np.ndarray):
+        for start in range(0, len(positions), chunk_size):
+            chunk = positions[start:start + chunk_size].astype(np.uint64)
+            yield score_bitboards(np.ascontiguousarray(chunk[:, 0]), np.ascontiguousarray(chunk[:, 1]))
+        return
+    positions = iter(positions)
+    while True:
+        move_strings = list(itertools.islice(positions, chunk_size))
+        if not move_strings:
+            return
+        yellow, red, valid = parse_positions(move_strings)
+        scores = score_bitboards(yellow, red)
+        scores['valid'] &= valid
+        scores['moves'] = move_strings
+        yield scores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score the positions of a file of move strings, one per line")
+    parser.add_argument('input', help="File of move strings, - for stdin")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    lines = sys.stdin if args.input == '-' else open(args.input)
+    # One line per position: moves, score for the player to move, winner, legal columns numbered from 1
+    for scores in score_positions((line.strip() for line in lines), args.chunk_size):
+        for moves, score, winner, legal, valid in zip(scores['moves'], scores['score'], scores['winner'],
+                                                      scores['legal'], scores['valid']):
+            if not valid:
+                print(f"{moves} invalid")
+                continue
+            columns = ''.join(str(action + 1) for action in np.flatnonzero(legal))
+            print(f"{moves} {score} {winner} {columns or '-'}")
@@ -6,3 +6,9 @@ SIZE_X = 7
 SIZE_Y = 6
 LEFT = -1
 RIGHT = 1
+WIN_SCORE = 1000
+MATE_THRESHOLD = WIN_SCORE - SIZE_X * SIZE_Y - 1
+SCORES_FOR_LINES = {
+    2: 1,
+    3: 4,
+}
@@ -0,0 +1,213 @@
+import random
+
+from constants import *
+
+# Each column is stored on SIZE_Y + 1 bits, the extra top bit always stays empty so that shifted masks never
+# wrap from one column to the next. Bit (x * COLUMN_BITS + h) is the cell of column x at height h (0 is the bottom).
+COLUMN_BITS = SIZE_Y + 1
+SHIFTS = (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1)  # Vertical, horizontal and the two diagonals
+BOTTOM_MASK = sum(1 << (x * COLUMN_BITS) for x in range(SIZE_X))
+BOARD_MASK = BOTTOM_MASK * ((1 << SIZE_Y) - 1)
+COLUMN_MASK = (1 << COLUMN_BITS) - 1
+N_CELLS = SIZE_X * SIZE_Y
+# Score of a line indexed by its length, lines of 4 or more are wins and are never evaluated
+LINE_SCORES = [SCORES_FOR_LINES.get(length, 0) for length in range(2 * SIZE_X)]
+ZOBRIST_SEED = 4
+
+# Zobrist keys, indexed by color then bit. The seed is fixed so that keys are identical in every process
+_zobrist_random = random.Random(ZOBRIST_SEED)
+ZOBRIST = [[_zobrist_random.getrandbits(64) for _ in range(SIZE_X * COLUMN_BITS)] for _ in range(3)]
+# Bit of the same cell on the board mirrored around the center column
+MIRROR_BITS = [(SIZE_X - 1 - bit // COLUMN_BITS) * COLUMN_BITS + bit % COLUMN_BITS for bit in range(SIZE_X * COLUMN_BITS)]
+
+
+def bit_to_cell(bit):
+    return bit // COLUMN_BITS, SIZE_Y - 1 - bit % COLUMN_BITS
+
+
+# Move strings list the played columns, numbered from 1 like in the usual Connect 4 notation
+def parse_moves(moves):
+    actions = []
+    for move in moves:
+        if not move.isdigit() or not 1 <= int(move) <= SIZE_X:
+            raise ValueError(f"Invalid move ! Move: {move}")
+        actions.append(int(move) - 1)
+    return actions
+
+
+def format_moves(actions):
+    return ''.join(str(action + 1) for action in actions)
+
+
+def mirror_action(action):
+    return SIZE_X - 1 - action
+
+
+def mirror(bitboard):
+    mirrored = 0
+    for x in range(SIZE_X):
+        mirrored |= ((bitboard >> (x * COLUMN_BITS)) & COLUMN_MASK) << ((SIZE_X - 1 - x) * COLUMN_BITS)
+    return mirrored
+
+
+def score_lines(pieces):
+    score = 0
+    for shift in SHIFTS:
+        starts = pieces & ~(pieces << shift)  # First piece of every line in that direction
+        pairs = starts & (pieces >> shift)
+        triples = pairs & (pieces >> 2 * shift)
+        score += SCORES_FOR_LINES[2] * bin(pairs & ~triples).count('1')
+        score += SCORES_FOR_LINES[3] * bin(triples & ~(pieces >> 3 * shift)).count('1')
+    return score
+
+
+# Variation of the lines score when the move bit is added to pieces
+def score_delta(pieces, move):
+    delta = 0
+    for shift in SHIFTS:
+        left = 0
+        probe = move >> shift
+        while pieces & probe:
+            left += 1
+            probe >>= shift
+        right = 0
+        probe = move << shift
+        while pieces & probe:
+            right += 1
+            probe <<= shift
+        if left or right:
+            delta += LINE_SCORES[left + right + 1] - LINE_SCORES[left] - LINE_SCORES[right]
+    return delta
+
+
+# Empty cells that would complete a line of 4 for pieces
+def winning_cells(pieces, mask):
+    cells = (pieces << 1) & (pieces << 2) & (pieces << 3)
+    for shift in SHIFTS[1:]:
+        pair = (pieces << shift) & (pieces << 2 * shift)
+        cells |= pair & (pieces << 3 * shift)
+        cells |= pair & (pieces >> shift)
+        pair = (pieces >> shift) & (pieces >> 2 * shift)
+        cells |= pair & (pieces << shift)
+        cells |= pair & (pieces >> 3 * shift)
+    return cells & (BOARD_MASK ^ mask)
+
+
+def winning_shift(pieces):
+    for shift in SHIFTS:
+        m = pieces & (pieces >> shift)
+        if m & (m >> 2 * shift):
+            return shift
+    return 0
+
+
+class Game:
+    def __init__(self, incremental_evaluation=True):
+        self.masks = [0, 0, 0]  # Indexed by color, masks[EMPTY] is unused
+        self.heights = [x * COLUMN_BITS for x in range(SIZE_X)]  # Next free bit of each column
+        self.turn = YELLOW
+        self.cur_depths = [SIZE_Y - 1 for _ in range(SIZE_X)]
+        self.actions = []
+        self.winner = None
+        self.key = 0
+        self.mirror_key = 0  # Zobrist key of the mirrored position
+        self.incremental_evaluation = incremental_evaluation
+        self.scores = [0, 0, 0]  # Lines score of each color, only maintained with incremental_evaluation
+        self.score_deltas = []
+
+    @classmethod
+    def from_actions(cls, actions):
+        game = cls()
+        for action in actions:
+            game.apply_action(action)
+        return game
+
+    def apply_action(self, action):
+        if self.cur_depths[action] < 0:
+            raise ValueError(f"Invalid action ! Action:  {action}")
+
+        bit = self.heights[action]
+        move = 1 << bit
+        if self.incremental_evaluation:
+            delta = score_delta(self.masks[self.turn], move)
+            self.scores[self.turn] += delta
+            self.score_deltas.append(delta)
+        pieces = self.masks[self.turn] | move
+        self.masks[self.turn] = pieces
+        self.key ^= ZOBRIST[self.turn][bit]
+        self.mirror_key ^= ZOBRIST[self.turn][MIRROR_BITS[bit]]
+        self.heights[action] += 1
+        self.cur_depths[action] -= 1
+        self.actions.append(action)
+
+        shift = winning_shift(pieces)
+        if shift:
+            self.winner = {
+                'color': self.turn,
+                'winning_line': self.winning_line(pieces, shift),
+            }
+        elif len(self.actions) == N_CELLS:
+            self.winner = DRAW
+
+        self.turn = RED if self.turn == YELLOW else YELLOW
+
+    def undo_action(self):
+        action = self.actions.pop()
+        self.turn = RED if self.turn == YELLOW else YELLOW
+        bit = self.heights[action] - 1
+        self.heights[action] = bit
+        self.cur_depths[action] += 1
+        self.masks[self.turn] ^= 1 << bit
+        self.key ^= ZOBRIST[self.turn][bit]
+        self.mirror_key ^= ZOBRIST[self.turn][MIRROR_BITS[bit]]
+        if self.incremental_evaluation:
+            self.scores[self.turn] -= self.score_deltas.pop()
+        self.winner = None
+
+    def successors(self):
+        return set(i for i in range(SIZE_X) if self.cur_depths[i] >= 0)
+
+    def occupied_mask(self):
+        return self.masks[YELLOW] | self.masks[RED]
+
+    # Unique key of the position: the pieces of the player to move plus one bit above the top piece of every column.
+    # Columns never carry into each other so mirror(position_key()) is the key of the mirrored position
+    def position_key(self):
+        return self.masks[self.turn] + self.occupied_mask() + BOTTOM_MASK
+
+    # A position and its mirror share the same canonical key, the smallest of their two keys. The boolean tells whether
+    # it is the key of the mirror, in which case the actions stored with it have to go through mirror_action
+    def canonical_key(self):
+        if self.mirror_key < self.key:
+            return self.mirror_key, True
+        return self.key, False
+
+    # Same with the unique position key, for the tables stored on disk
+    def canonical_position_key(self):
+        key = self.position_key()
+        mirrored_key = mirror(key)
+        if mirrored_key < key:
+            return mirrored_key, True
+        return key, False
+
+    @staticmethod
+    def winning_line(pieces, shift):
+        m = pieces & (pieces >> shift)
+        m &= m >> 2 * shift
+        start = (m & -m).bit_length() - 1
+        return sorted(bit_to_cell(start + k * shift) for k in range(4))
+
+    @property
+    def state(self):
+        state = [[EMPTY for _ in range(SIZE_Y)] for _ in range(SIZE_X)]
+        for color in (YELLOW, RED):
+            pieces = self.masks[color]
+            while pieces:
+                bit = pieces & -pieces
+                x, y = bit_to_cell(bit.bit_length() - 1)
+                state[x][y] = color
+                pieces ^= bit
+        return state
+
+    def __hash__(self):
+        return self.canonical_key()[0]
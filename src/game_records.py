@@ -0,0 +1,210 @@
+import argparse
+import array
+import os
+import struct
+
+from constants import *
+from game import Game, format_moves
+
+MAGIC = b'C4GAMES1'
+# Number of moves, result (EMPTY when the game isn't over, a color or DRAW) with HAS_STATS when every move is followed
+# by its statistics
+HEADER = struct.Struct('<BB')
+HAS_STATS = 0x80
+MOVE_STATS = struct.Struct('<hBI')  # Score for the player who moved, search depth, nodes explored
+MOVE_BITS = 3
+INDEX_SUFFIX = '.idx'  # The index file holds the offset of every record as native 64 bits integers
+
+
+def game_result(game):
+    if game.winner is None:
+        return EMPTY
+    return DRAW if game.winner == DRAW else game.winner['color']
+
+
+def pack_moves(actions):
+    packed = 0
+    for i, action in enumerate(actions):
+        packed |= action << (i * MOVE_BITS)
+    return packed.to_bytes(moves_bytes(len(actions)), 'little')
+
+
+def unpack_moves(data, n_moves):
+    packed = int.from_bytes(data, 'little')
+    return [(packed >> (i * MOVE_BITS)) & ((1 << MOVE_BITS) - 1) for i in range(n_moves)]
+
+
+def moves_bytes(n_moves):
+    return (n_moves * MOVE_BITS + 7) // 8
+
+
+# Size of a whole record from its header
+def record_size(header):
+    n_moves, flags = HEADER.unpack(header)
+    return HEADER.size + moves_bytes(n_moves) + (n_moves * MOVE_STATS.size if flags & HAS_STATS else 0)
+
+
+def encode_record(actions, result, stats=None):
+    data = HEADER.pack(len(actions), result | (HAS_STATS if stats is not None else 0)) + pack_moves(actions)
+    if stats is not None:
+        if len(stats) != len(actions):
+            raise ValueError(f"Invalid stats ! Moves: {len(actions)}, stats: {len(stats)}")
+        for score, depth, nodes in stats:
+            data += MOVE_STATS.pack(max(min(score, 0x7FFF), -0x8000), min(depth, 0xFF), min(nodes, 0xFFFFFFFF))
+    return data
+
+
+# Reads the record starting at the current position of f, returns None at the end of the file. A record is a dict
+# with 'actions', 'result' and 'stats', a list of (score, depth, nodes) or None
+def read_record(f):
+    header = f.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ValueError("Truncated game record !")
+    n_moves, flags = HEADER.unpack(header)
+    moves_size = moves_bytes(n_moves)
+    data = f.read(moves_size)
+    if len(data) < moves_size:
+        raise ValueError("Truncated game record !")
+    actions = unpack_moves(data, n_moves)
+    stats = None
+    if flags & HAS_STATS:
+        data = f.read(n_moves * MOVE_STATS.size)
+        if len(data) < n_moves * MOVE_STATS.size:
+            raise ValueError("Truncated game record !")
+        stats = list(MOVE_STATS.iter_unpack(data))
+    return {'actions': actions, 'result': flags & ~HAS_STATS, 'stats': stats}
+
+
+def check_magic(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"Not a game records file ! Path: {path}")
+
+
+# Appends records to a file, which is created when it doesn't exist. The index is written along the records, after
+# being rebuilt when it doesn't match the records already in the file
+class GameRecordWriter:
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+            self.file.flush()
+            open(path + INDEX_SUFFIX, 'wb').close()
+        else:
+            load_index(path)
+        self.index = open(path + INDEX_SUFFIX, 'ab')
+
+    def write(self, actions, result, stats=None):
+        self.index.write(array.array('Q', [self.file.tell()]).tobytes())
+        self.file.write(encode_record(actions, result, stats))
+
+    def write_game(self, game, stats=None):
+        self.write(game.actions, game_result(game), stats)
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+# Records of a file one at a time, the file is never loaded as a whole
+def read_records(path):
+    with open(path, 'rb') as f:
+        check_magic(f, path)
+        while True:
+            record = read_record(f)
+            if record is None:
+                return
+            yield record
+
+
+# Every record replayed through Game.apply_action, yields (game, record) with the game in its final position
+def replay_games(path):
+    for record in read_records(path):
+        yield Game.from_actions(record['actions']), record
+
+
+# Random access to the records through the index, which is rebuilt when it is missing or doesn't match the file
+class GameRecords:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        check_magic(self.file, path)
+        self.offsets = load_index(path)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, n):
+        if not 0 <= n < len(self.offsets):
+            raise IndexError(f"Invalid game ! Game: {n}, games: {len(self.offsets)}")
+        self.file.seek(self.offsets[n])
+        return read_record(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+# Every record of the file has to be indexed in order: the first one starts right after the magic, each one ends where
+# the next one starts and the last one at the end of the file. Only the headers of the records are read
+def index_matches(f, offsets):
+    size = os.fstat(f.fileno()).st_size
+    end = len(MAGIC)
+    for offset in offsets:
+        if offset != end:
+            return False
+        f.seek(offset)
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return False
+        end = offset + record_size(header)
+    return end == size
+
+
+# Offsets of the records from the index file, which is rebuilt when it is missing or doesn't match the records
+def load_index(path):
+    offsets = array.array('Q')
+    index_path = path + INDEX_SUFFIX
+    if os.path.exists(index_path):
+        with open(index_path, 'rb') as f:
+            data = f.read()
+        offsets.frombytes(data[:len(data) - len(data) % offsets.itemsize])
+    with open(path, 'rb') as f:
+        check_magic(f, path)
+        if index_matches(f, offsets):
+            return offsets
+    return build_index(path)
+
+
+# Scans the records and writes the index file again
+def build_index(path):
+    offsets = array.array('Q')
+    with open(path, 'rb') as f:
+        check_magic(f, path)
+        while True:
+            offset = f.tell()
+            if read_record(f) is None:
+                break
+            offsets.append(offset)
+    with open(path + INDEX_SUFFIX, 'wb') as f:
+        offsets.tofile(f)
+    return offsets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print the games of a game records file, one move string per line")
+    parser.add_argument('path')
+    parser.add_argument('--game', type=int, default=None, help="Only print this game, through the index")
+    args = parser.parse_args()
+
+    results = {EMPTY: 'unfinished', YELLOW: 'yellow', RED: 'red', DRAW: 'draw'}
+    if args.game is not None:
+        records = GameRecords(args.path)
+        if not 0 <= args.game < len(records):
+            parser.error(f"Invalid game ! Game: {args.game}, games: {len(records)}")
+        selected = [records[args.game]]
+        records.close()
+    else:
+        selected = read_records(args.path)
+    for record in selected:
+        print(f"{format_moves(record['actions'])} {results[record['result']]}")
@@ -2,6 +2,7 @@ import os
 
 import pygame
 
+from ai import evaluate_game
 from constants import *
 
 
@@ -17,6 +18,11 @@ BLUE_COLOR = (40, 40, 200)
 RED_COLOR = (200, 0, 0)
 YELLOW_COLOR = (240, 240, 10)
 BACKGROUND_COLOR = (240, 240, 240)
+TEXT_LINE_PIXEL = int(0.25 * CELL_PIXEL)
+STATS_LINE_PIXEL = int(0.18 * CELL_PIXEL)
+STATS_ITERATIONS = 12  # Number of iterations shown in the statistics panel
+TEXT_CACHE_SIZE = 256  # Number of rendered texts kept before the cache is emptied
+STATS_COLUMNS = (("DEPTH", 0), ("NODES", 0.45), ("MS", 1.05), ("TT%", 1.55), ("CUT1%", 2.05))  # Title, x offset in cells
 
 
 class GUI:
@@ -26,43 +32,133 @@ class GUI:
         self.display = pygame.display.set_mode((SIZE_X_PIXEL + RIGHT_PANEL_PIXEL, TOP_EMPTY_SPACE_PIXEL + SIZE_Y_PIXEL))
         pygame.display.set_caption("Puissance 4")
         self.text_font = pygame.font.Font('freesansbold.ttf', int(0.2 * CELL_PIXEL))
+        self.stats_font = pygame.font.Font('freesansbold.ttf', int(0.14 * CELL_PIXEL))
 
         self.game = game
         self.robot = robot
         self.ai = ai
+        self.thinking = False
+
+        # Pre-rendered cells, indexed by color then by whether the piece is the last one played
+        self.cell_surfaces = {}
+        for color, circle_color in ((EMPTY, BACKGROUND_COLOR), (YELLOW, YELLOW_COLOR), (RED, RED_COLOR)):
+            surfaces = []
+            for marked in (False, True):
+                surface = pygame.Surface((CELL_PIXEL, CELL_PIXEL)).convert()
+                surface.fill(BLUE_COLOR)
+                pygame.draw.circle(surface, circle_color, (CELL_PIXEL // 2, CELL_PIXEL // 2), CIRCLE_RADIUS_PIXEL)
+                if marked:
+                    pygame.draw.circle(surface, BLACK_COLOR, (CELL_PIXEL // 2, CELL_PIXEL // 2),
+                                       int(CIRCLE_RADIUS_PIXEL * 1.25), CIRCLE_RADIUS_PIXEL // 10)
+                surfaces.append(surface)
+            self.cell_surfaces[color] = surfaces
+        self.cursor_surface = pygame.Surface((CELL_PIXEL, CELL_PIXEL)).convert()
+        self.cursor_surface.fill(BACKGROUND_COLOR)
+        pygame.draw.circle(self.cursor_surface, YELLOW_COLOR, (CELL_PIXEL // 2, CELL_PIXEL // 2), CIRCLE_RADIUS_PIXEL)
+        self.text_surfaces = {}  # (font, text) -> rendered surface
+
+        # What is currently on the screen, only the differences are redrawn
+        self.full_redraw = True
+        self.drawn_cells = None
+        self.drawn_position = None
+        self.drawn_cursor = None
+        self.drawn_texts = []
+        self.drawn_stats = None
+
+    def render_text(self, font, text):
+        surface = self.text_surfaces.get((font, text))
+        if surface is None:
+            if len(self.text_surfaces) > TEXT_CACHE_SIZE:
+                self.text_surfaces.clear()
+            surface = font.render(text, True, BLACK_COLOR)
+            self.text_surfaces[font, text] = surface
+        return surface
 
     def draw(self):
-        self.display.fill(BACKGROUND_COLOR)
-        pygame.draw.rect(self.display, BLUE_COLOR, (0, TOP_EMPTY_SPACE_PIXEL, SIZE_X_PIXEL, SIZE_Y_PIXEL))
-        if self.game.turn == YELLOW:
-            pygame.draw.circle(self.display,
-                               YELLOW_COLOR,
-                               (self.robot.cur_column * CELL_PIXEL + CELL_PIXEL // 2, CELL_PIXEL // 2),
-                               CIRCLE_RADIUS_PIXEL)
-        for i in range(SIZE_X):
-            for j in range(SIZE_Y):
-                pygame.draw.circle(self.display,
-                                   RED_COLOR if self.game.state[i][j] == RED else YELLOW_COLOR if self.game.state[i][j] == YELLOW else BACKGROUND_COLOR,
-                                   (i * CELL_PIXEL + CELL_PIXEL // 2, TOP_EMPTY_SPACE_PIXEL + j * CELL_PIXEL + CELL_PIXEL // 2),
-                                   CIRCLE_RADIUS_PIXEL)
-        if self.game.actions:
-            x, y = self.game.actions[-1], self.game.cur_depths[self.game.actions[-1]] + 1
-            pygame.draw.circle(self.display,
-                               BLACK_COLOR,
-                               (x * CELL_PIXEL + CELL_PIXEL // 2, TOP_EMPTY_SPACE_PIXEL + y * CELL_PIXEL + CELL_PIXEL // 2),
-                               int(CIRCLE_RADIUS_PIXEL * 1.25),
-                               CIRCLE_RADIUS_PIXEL // 10)
-
-        texts_to_draw = ("LAST AI ACTION",
+        rects = []
+        if self.full_redraw:
+            self.display.fill(BACKGROUND_COLOR)
+            rects.append(self.display.get_rect())
+            self.full_redraw = False
+            self.drawn_cells = [[None] * SIZE_Y for _ in range(SIZE_X)]
+            self.drawn_position = None
+            self.drawn_cursor = None
+            self.drawn_texts = []
+            self.drawn_stats = None
+
+        cursor = self.robot.cur_column if self.game.turn == YELLOW else None
+        if cursor != self.drawn_cursor:
+            if self.drawn_cursor is not None:
+                rects.append(self.display.fill(BACKGROUND_COLOR, (self.drawn_cursor * CELL_PIXEL, 0, CELL_PIXEL, CELL_PIXEL)))
+            if cursor is not None:
+                rects.append(self.display.blit(self.cursor_surface, (cursor * CELL_PIXEL, 0)))
+            self.drawn_cursor = cursor
+
+        position = self.game.masks[YELLOW], self.game.masks[RED], len(self.game.actions)
+        if position != self.drawn_position:
+            state = self.game.state
+            last = None
+            if self.game.actions:
+                last = self.game.actions[-1], self.game.cur_depths[self.game.actions[-1]] + 1
+            for i in range(SIZE_X):
+                for j in range(SIZE_Y):
+                    cell = state[i][j], (i, j) == last
+                    if cell != self.drawn_cells[i][j]:
+                        rects.append(self.display.blit(self.cell_surfaces[cell[0]][cell[1]],
+                                                       (i * CELL_PIXEL, TOP_EMPTY_SPACE_PIXEL + j * CELL_PIXEL)))
+                        self.drawn_cells[i][j] = cell
+            self.drawn_position = position
+
+        nodes_explored, max_depth = self.ai.search_counters()
+        texts_to_draw = ("AI THINKING..." if self.thinking else "LAST AI ACTION",
                          "  SCORE: {}".format(self.ai.action[0]),
-                         "  NODES EXPLORED: {}".format(self.ai.nodes_explored),
-                         "  DEPTH: {}".format(self.ai.max_depth - 1),
-                         "CURRENT EVALUATION: {}".format(self.ai.evaluate(0)))
-        for i, text in enumerate(texts_to_draw):
-            text_surface = self.text_font.render(text, True, BLACK_COLOR)
-            self.display.blit(text_surface, (SIZE_X_PIXEL + 0.1 * CELL_PIXEL, TOP_EMPTY_SPACE_PIXEL + 0.25 * i * CELL_PIXEL))
+                         "  NODES EXPLORED: {}".format(nodes_explored),
+                         "  DEPTH: {}".format(max_depth - 1),
+                         "CURRENT EVALUATION: {}".format(evaluate_game(self.game, self.ai.color, 0)))
+        if self.ai.proven_outcome is not None:
+            if self.ai.proven_outcome['outcome'] == 'draw':
+                texts_to_draw += ("  PROVEN: DRAW",)
+            else:
+                texts_to_draw += ("  PROVEN: {} IN {} PLIES".format(self.ai.proven_outcome['outcome'].upper(), self.ai.proven_outcome['distance']),)
+        for i in range(max(len(texts_to_draw), len(self.drawn_texts))):
+            text = texts_to_draw[i] if i < len(texts_to_draw) else None
+            if i < len(self.drawn_texts) and text == self.drawn_texts[i]:
+                continue
+            rect = (SIZE_X_PIXEL, TOP_EMPTY_SPACE_PIXEL + i * TEXT_LINE_PIXEL, RIGHT_PANEL_PIXEL, TEXT_LINE_PIXEL)
+            rects.append(self.display.fill(BACKGROUND_COLOR, rect))
+            if text is not None:
+                self.display.blit(self.render_text(self.text_font, text), (SIZE_X_PIXEL + 0.1 * CELL_PIXEL, rect[1]))
+        self.drawn_texts = texts_to_draw
+        top = TOP_EMPTY_SPACE_PIXEL + (len(texts_to_draw) + 1) * TEXT_LINE_PIXEL
+        last_iteration = self.ai.iterations[-1] if self.ai.iterations else None
+        if self.drawn_stats is None or self.drawn_stats[0] != top or self.drawn_stats[1] is not last_iteration:
+            rects.append(self.draw_stats(top))
+            self.drawn_stats = top, last_iteration
 
-        pygame.display.update()
+        if rects:
+            pygame.display.update(rects)
+
+    def draw_stats(self, top):
+        rect = self.display.fill(BACKGROUND_COLOR, (SIZE_X_PIXEL, top, RIGHT_PANEL_PIXEL, TOP_EMPTY_SPACE_PIXEL + SIZE_Y_PIXEL - top))
+        self.display.blit(self.render_text(self.text_font, "SEARCH STATISTICS"), (SIZE_X_PIXEL + 0.1 * CELL_PIXEL, top))
+        rows = [[title for title, _ in STATS_COLUMNS]]
+        for iteration in self.ai.iterations[-STATS_ITERATIONS:]:
+            rows.append([
+                str(iteration['depth']),
+                str(iteration['nodes']),
+                str(int(iteration['time'] * 1000)),
+                str(int(100 * iteration['tt_hits'] / iteration['tt_probes'])) if iteration['tt_probes'] else "-",
+                str(int(100 * iteration['first_move_cutoff_rate'])) if iteration['first_move_cutoff_rate'] is not None else "-",
+            ])
+        y = top + TEXT_LINE_PIXEL
+        for row in rows:
+            for text, (_, x) in zip(row, STATS_COLUMNS):
+                self.display.blit(self.render_text(self.stats_font, text), (SIZE_X_PIXEL + (0.1 + x) * CELL_PIXEL, y))
+            y += STATS_LINE_PIXEL
+        if self.ai.iterations:
+            variation = ' '.join(str(action + 1) for action in self.ai.iterations[-1]['principal_variation'])
+            self.display.blit(self.render_text(self.stats_font, "PV: " + variation), (SIZE_X_PIXEL + 0.1 * CELL_PIXEL, y))
+        return rect
 
     def draw_winner_line(self, winner):
         pygame.draw.line(self.display,
@@ -71,4 +167,5 @@ class GUI:
                          (winner['winning_line'][3][0] * CELL_PIXEL + CELL_PIXEL // 2, TOP_EMPTY_SPACE_PIXEL + winner['winning_line'][3][1] * CELL_PIXEL + CELL_PIXEL // 2),
                          width=8)
         pygame.display.update()
+        self.full_redraw = True  # The line covers several cells, the next frame starts from scratch
 
@@ -1,5 +1,10 @@
+import gc
+from array import array
+from random import getrandbits
+
 from mindstorms import ColorSensor, MSHub, Motor
 from mindstorms.control import Timer, wait_for_seconds
+from utime import ticks_add, ticks_diff, ticks_ms
 
 
 EMPTY = 0
@@ -12,13 +17,51 @@ LEFT = -1
 RIGHT = 1
 
 TIMEOUT_TURN = 1
+COMPACT_SEARCH = True  # Search without any allocation per node, AI builds a tree of Node objects instead
+PONDERING = True  # Search the human replies while waiting for the sensors, needs COMPACT_SEARCH
+EARLY_MOVE_DEPTH = 4  # The carriage heads to the best action once it is searched at this depth
 DIRECTIONS = ((0, 1), (1, 0), (1, 1), (-1, 1))
 SCORES_FOR_LINES = {
     2: 1,
     3: 4,
 }
 
+
+# Every possible four in a row, and the indexes of the windows each cell belongs to
+def build_windows():
+    windows = []
+    cell_windows = [[[] for _ in range(SIZE_Y)] for _ in range(SIZE_X)]
+    for i in range(SIZE_X):
+        for j in range(SIZE_Y):
+            for dx, dy in DIRECTIONS:
+                if 0 <= i + 3 * dx < SIZE_X and j + 3 * dy < SIZE_Y:
+                    for k in range(4):
+                        cell_windows[i + k * dx][j + k * dy].append(len(windows))
+                    windows.append(tuple((i + k * dx, j + k * dy) for k in range(4)))
+    return windows, cell_windows
+
+
+WINDOWS, CELL_WINDOWS = build_windows()
+# Score of a window by number of pieces, when the other color has none in it. A full window is a win, scored apart
+WINDOW_SCORES = (0, 0, SCORES_FOR_LINES[2], SCORES_FOR_LINES[3], 0)
+
+# Random keys of every cell for each color. 30 bits keep the position keys small ints on the hub
+ZOBRIST = [None] + [array('i', (getrandbits(30) for _ in range(SIZE_X * SIZE_Y))) for _ in (YELLOW, RED)]
+
+CENTER_ORDER = (3, 2, 4, 1, 5, 0, 6)
+NO_ACTION = 255
+TABLE_BITS = 11
+TABLE_MASK = (1 << TABLE_BITS) - 1
+EXACT = 0
+LOWER = 1
+UPPER = 2
+MATE_THRESHOLD = 1000 - SIZE_X * SIZE_Y - 1
+CHECK_INTERVAL = 64  # Number of nodes between two checks of the timer, the memory and the robot, a power of 2
+
+START_COLUMN = 3
 MOVEMENT_SPEED = 20
+MOVEMENT_TOLERANCE = 5  # Degrees
+SENSOR_POLL_MS = 100
 RELEASE_SPEED = 100
 COLUMN_ROTATION = 105
 
@@ -58,48 +101,67 @@ class Node:
 
 class Game:
     def __init__(self):
-        self.state = [[EMPTY for _ in range(SIZE_Y)] for _ in range(SIZE_X)]
+        self.board = bytearray(SIZE_X * SIZE_Y)  # Color of every cell, column by column
         self.turn = YELLOW
         self.cur_depths = [SIZE_Y - 1 for _ in range(SIZE_X)]
-        self.actions = []
-        self.winner = None
-
-    def check_for_win(self):
-        for i in range(SIZE_X):
-            for j in range(SIZE_Y):
-                if self.state[i][j] != EMPTY:
-                    for dx, dy in DIRECTIONS:
-                        if 0 <= i + 3 * dx < SIZE_X and j + 3 * dy < SIZE_Y and all(self.state[i][j] == self.state[i + k * dx][j + k * dy] for k in range(1, 4)):
-                            self.winner = {
-                                'color': self.state[i][j],
-                                'winning_line': [(i + k * dx, j + k * dy) for k in range(4)]
-                            }
-                            return
-        if all(depth < 0 for depth in self.cur_depths):
-            self.winner = DRAW
+        self.actions = bytearray(SIZE_X * SIZE_Y)
+        self.n_actions = 0
+        self.winner = None  # None, YELLOW, RED or DRAW
+        self.window_counts = [None, bytearray(len(WINDOWS)), bytearray(len(WINDOWS))]  # Pieces of each color in every window
+        self.scores = [0, 0, 0]  # Sum of the scores of the windows only one color can still complete
+        self.key = 0
 
     def apply_action(self, action):
         if self.cur_depths[action] >= 0:
-            self.state[action][self.cur_depths[action]] = self.turn
+            j = self.cur_depths[action]
+            self.board[action * SIZE_Y + j] = self.turn
+            self.key ^= ZOBRIST[self.turn][action * SIZE_Y + j]
             self.cur_depths[action] -= 1
-            self.check_for_win()
-            self.turn = RED if self.turn == YELLOW else YELLOW
-            self.actions.append(action)
+            counts = self.window_counts[self.turn]
+            enemy = RED if self.turn == YELLOW else YELLOW
+            enemy_counts = self.window_counts[enemy]
+            for window in CELL_WINDOWS[action][j]:
+                count = counts[window]
+                if enemy_counts[window] == 0:
+                    self.scores[self.turn] += WINDOW_SCORES[count + 1] - WINDOW_SCORES[count]
+                    if count == 3:
+                        self.winner = self.turn
+                elif count == 0:
+                    self.scores[enemy] -= WINDOW_SCORES[enemy_counts[window]]  # The window is now blocked
+                counts[window] = count + 1
+            if self.winner is None and self.n_actions == SIZE_X * SIZE_Y - 1:
+                self.winner = DRAW
+            self.turn = enemy
+            self.actions[self.n_actions] = action
+            self.n_actions += 1
         else:
             raise ValueError("Invalid action ! Action: {}".format(action))
 
     def undo_action(self):
-        action = self.actions.pop()
-        self.state[action][self.cur_depths[action] + 1] = EMPTY
+        self.n_actions -= 1
+        action = self.actions[self.n_actions]
+        j = self.cur_depths[action] + 1
+        self.board[action * SIZE_Y + j] = EMPTY
         self.cur_depths[action] += 1
+        enemy = self.turn
         self.turn = RED if self.turn == YELLOW else YELLOW
+        self.key ^= ZOBRIST[self.turn][action * SIZE_Y + j]
+        counts = self.window_counts[self.turn]
+        enemy_counts = self.window_counts[enemy]
+        for window in CELL_WINDOWS[action][j]:
+            count = counts[window] - 1
+            counts[window] = count
+            if enemy_counts[window] == 0:
+                self.scores[self.turn] -= WINDOW_SCORES[count + 1] - WINDOW_SCORES[count]
+            elif count == 0:
+                self.scores[enemy] += WINDOW_SCORES[enemy_counts[window]]
         self.winner = None
 
     def successors(self):
         return set(i for i in range(SIZE_X) if self.cur_depths[i] >= 0)
 
     def __hash__(self):
-        return hash(tuple(tuple(column) for column in self.state))
+        return self.key
 
 
 class AI:
@@ -121,33 +183,8 @@ class AI:
             if self.game.winner == DRAW:
                 return 0
             else:
-                return 1000 - depth if self.game.winner['color'] == self.color else -1000 + depth
-        score = 0
-        for i in range(SIZE_X):
-            for j in range(SIZE_Y):
-                if self.game.state[i][j] != EMPTY:
-                    for dx, dy in DIRECTIONS:
-                        for line_length in (2, 3):
-                            if 0 <= i + (line_length - 1) * dx < SIZE_X and j + (line_length - 1) * dy < SIZE_Y and \
-                                    all(self.game.state[i][j] == self.game.state[i + k * dx][j + k * dy] for k in range(1, line_length)):
-                                max_length = line_length
-                                # Search the additional length that could be added in the reverse direction
-                                n = -1
-                                while 0 <= i + n * dx < SIZE_X and 0 <= j + n * dy < SIZE_Y and self.game.state[i + n * dx][j + n * dy] == EMPTY:
-                                    n -= 1
-                                    max_length += 1
-                                # Now search the additional length that could be added in the original direction
-                                n = line_length
-                                while 0 <= i + n * dx < SIZE_X and 0 <= j + n * dy < SIZE_Y and self.game.state[i + n * dx][j + n * dy] == EMPTY:
-                                    n += 1
-                                    max_length += 1
-                                if max_length >= 4:
-                                    score_for_line = SCORES_FOR_LINES[line_length]
-                                    if self.game.state[i][j] == self.color:
-                                        score += score_for_line
-                                    else:
-                                        score -= score_for_line
-        return score
+                return 1000 - depth if self.game.winner == self.color else -1000 + depth
+        return self.game.scores[self.color] - self.game.scores[RED if self.color == YELLOW else YELLOW]
 
     # Minimax with alpha-beta pruning
     def minimax(self, node, prev_tree_node, alpha, beta, depth):
@@ -215,6 +252,187 @@ class AI:
         return self.action[1]
 
 
+def value_to_table(value, depth):
+    if value > MATE_THRESHOLD:
+        return value + depth
+    if value < -MATE_THRESHOLD:
+        return value - depth
+    return value
+
+
+def value_from_table(value, depth):
+    if value > MATE_THRESHOLD:
+        return value - depth
+    if value < -MATE_THRESHOLD:
+        return value + depth
+    return value
+
+
+# Same search as AI, but every structure is allocated once so that the garbage collector never has to run during a
+# search: move lists of every ply in a bytearray, transposition table in fixed size arrays, ints as return values
+class CompactAI(AI):
+    def __init__(self, game, color):
+        super().__init__(game, color)
+        self.best_action = NO_ACTION
+        self.moves = bytearray((SIZE_X * SIZE_Y + 1) * SIZE_X)  # SIZE_X slots for every ply
+        self.table_keys = array('i', (0 for _ in range(TABLE_MASK + 1)))
+        self.table_values = array('h', (0 for _ in range(TABLE_MASK + 1)))
+        self.table_depths = bytearray(TABLE_MASK + 1)  # Remaining depth + 1, 0 for an empty slot
+        self.table_flags = bytearray(TABLE_MASK + 1)
+        self.table_actions = bytearray(TABLE_MASK + 1)
+        self.peak_memory = 0
+        self.gc_count = 0
+        self.last_memory = 0
+        self.deadline = None  # ticks_ms value, None while pondering
+        self.poll = None  # Called between two slices of the search, the search stops when it returns True
+        # Results of the pondering by human reply
+        self.ponder_values = array('h', (0 for _ in range(SIZE_X)))
+        self.ponder_actions = bytearray(SIZE_X)
+        self.ponder_depths = bytearray(SIZE_X)
+
+    def sample_memory(self):
+        memory = gc.mem_alloc()
+        if memory < self.last_memory:
+            self.gc_count += 1  # The heap can only shrink when the garbage collector runs
+        if memory > self.peak_memory:
+            self.peak_memory = memory
+        self.last_memory = memory
+
+    # Fills the move list of the ply, the table action first then from the center to the sides
+    def generate_moves(self, depth, first_action):
+        base = depth * SIZE_X
+        n_moves = 0
+        if first_action != NO_ACTION and self.game.cur_depths[first_action] >= 0:
+            self.moves[base] = first_action
+            n_moves = 1
+        for action in CENTER_ORDER:
+            if action != first_action and self.game.cur_depths[action] >= 0:
+                self.moves[base + n_moves] = action
+                n_moves += 1
+        return n_moves
+
+    def minimax(self, alpha, beta, depth):
+        game = self.game
+        if self.nodes_explored & (CHECK_INTERVAL - 1) == 0:
+            self.sample_memory()
+            if (self.deadline is not None and ticks_diff(ticks_ms(), self.deadline) > 0) or \
+                    (self.poll is not None and self.poll()):
+                for _ in range(depth):
+                    game.undo_action()
+                raise TimeoutError
+        self.nodes_explored += 1
+        if depth == self.max_depth or game.winner is not None:
+            return self.evaluate(depth)
+        remaining_depth = self.max_depth - depth
+        index = game.key & TABLE_MASK
+        table_action = NO_ACTION
+        if self.table_depths[index] and self.table_keys[index] == game.key:
+            table_action = self.table_actions[index]
+            if self.table_depths[index] > remaining_depth and depth > 0:
+                value = value_from_table(self.table_values[index], depth)
+                flag = self.table_flags[index]
+                if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                    return value
+        alpha_orig, beta_orig = alpha, beta
+        best_action = NO_ACTION
+        maximizing = depth % 2 == 0
+        val = -100000 if maximizing else 100000
+        base = depth * SIZE_X
+        for k in range(base, base + self.generate_moves(depth, table_action)):
+            action = self.moves[k]
+            game.apply_action(action)
+            v = self.minimax(alpha, beta, depth + 1)
+            game.undo_action()
+            if maximizing:
+                if v > val:
+                    val = v
+                    best_action = action
+                    if v >= beta:
+                        break
+                    alpha = max(alpha, v)
+            else:
+                if v < val:
+                    val = v
+                    best_action = action
+                    if v <= alpha:
+                        break
+                    beta = min(beta, v)
+        if val <= alpha_orig:
+            flag = UPPER
+        elif val >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table_keys[index] = game.key
+        self.table_values[index] = value_to_table(val, depth)
+        self.table_depths[index] = remaining_depth + 1
+        self.table_flags[index] = flag
+        self.table_actions[index] = best_action
+        if depth == 0:
+            self.best_action = best_action
+        return val
+
+    # Searches every reply of the human, deeper and deeper until poll returns True. get_action continues from the
+    # depth reached for the reply actually played
+    def ponder(self, poll):
+        for reply in range(SIZE_X):
+            self.ponder_depths[reply] = 0
+        if self.game.winner is not None or self.game.turn == self.color:
+            return
+        self.deadline = None
+        self.poll = poll
+        self.nodes_explored = 0
+        try:
+            depth = 1
+            while depth <= sum(self.game.cur_depths) + 6:
+                for reply in CENTER_ORDER:
+                    if self.game.cur_depths[reply] < 0:
+                        continue
+                    self.game.apply_action(reply)
+                    try:
+                        if self.game.winner is None:
+                            self.max_depth = depth
+                            self.ponder_values[reply] = self.minimax(-100000, 100000, 0)
+                            self.ponder_actions[reply] = self.best_action
+                            self.ponder_depths[reply] = depth
+                    finally:
+                        self.game.undo_action()
+                depth += 1
+        except TimeoutError:
+            pass
+        finally:
+            self.poll = None
+
+    def get_action(self, poll=None):
+        gc.collect()
+        self.deadline = ticks_add(ticks_ms(), TIMEOUT_TURN * 1000)
+        self.poll = poll
+        self.nodes_explored = 0
+        self.max_depth = 1
+        self.peak_memory = 0
+        self.gc_count = 0
+        self.last_memory = gc.mem_alloc()
+        if self.game.n_actions:
+            reply = self.game.actions[self.game.n_actions - 1]
+            if self.ponder_depths[reply]:
+                self.action = self.ponder_values[reply], self.ponder_actions[reply]
+                self.max_depth = self.ponder_depths[reply] + 1
+        for reply in range(SIZE_X):
+            self.ponder_depths[reply] = 0
+        try:
+            while self.max_depth <= sum(self.game.cur_depths) + 7:  # max_depth shouldn't exceed the number of empty cells left
+                value = self.minimax(-100000, 100000, 0)
+                self.action = value, self.best_action
+                self.max_depth += 1
+        except TimeoutError:
+            pass
+        finally:
+            self.poll = None
+        print("Depth: {}, nodes: {}, peak memory: {} B, GC runs: {}".format(
+            self.max_depth - 1, self.nodes_explored, self.peak_memory, self.gc_count))
+        return self.action[1]
+
+
 class Robot:
     def __init__(self):
         self.release_motor = Motor('A')
@@ -222,53 +440,89 @@ class Robot:
         self.left_color = ColorSensor('F')
         self.mid_color = ColorSensor('D')
         self.right_color = ColorSensor('B')
-        self.cur_column = 3
+        self.cur_column = START_COLUMN
+        self.movement_motor.set_degrees_counted(0)
+        self.next_poll = ticks_ms()
+        self.human_action = None
 
     def move(self, n_cols):
         if (n_cols < 0 and self.cur_column > 0) or (n_cols > 0 and self.cur_column < SIZE_X - 1):
             self.cur_column += n_cols
             self.movement_motor.run_for_degrees(n_cols * COLUMN_ROTATION, MOVEMENT_SPEED)
 
+    # Degrees to turn the movement motor to reach the column
+    def degrees_to(self, column):
+        return (column - START_COLUMN) * COLUMN_ROTATION - self.movement_motor.get_degrees_counted()
+
+    # Starts or stops the carriage without waiting, to be called repeatedly until it reaches the column
+    def move_towards(self, column):
+        degrees = self.degrees_to(column)
+        if abs(degrees) <= MOVEMENT_TOLERANCE:
+            self.movement_motor.stop()
+        else:
+            self.movement_motor.start(MOVEMENT_SPEED if degrees > 0 else -MOVEMENT_SPEED)
+
     def apply_action(self, action):
-        n_cols = action - self.cur_column
-        if n_cols:
-            self.move(n_cols)
+        self.movement_motor.stop()
+        degrees = self.degrees_to(action)
+        if degrees:
+            self.movement_motor.run_for_degrees(degrees, MOVEMENT_SPEED)
+        self.cur_column = action
         self.drop_piece()
 
     def drop_piece(self):
         self.release_motor.run_to_position(330, speed=RELEASE_SPEED)
         self.release_motor.run_to_position(0, speed=RELEASE_SPEED)
 
+    # Moves the carriage as the human asks, returns True once the human has chosen the column, in human_action
+    def poll_sensors(self):
+        if ticks_diff(ticks_ms(), self.next_poll) < 0:
+            return False
+        self.next_poll = ticks_add(ticks_ms(), SENSOR_POLL_MS)
+        if self.left_color.get_color() == 'red':
+            self.move(-1)
+        elif self.right_color.get_color() == 'red':
+            self.move(-1)
+        elif self.mid_color.get_color() == 'red':
+            self.human_action = self.cur_column
+            return True
+        return False
+
 
 hub = MSHub()
 timer = Timer()
 
 game = Game()
-ai = AI(game, RED)
+ai = CompactAI(game, RED) if COMPACT_SEARCH else AI(game, RED)
 robot = Robot()
 
+
+# Called during the search of the AI turn, the carriage starts moving before the search is over
+def follow_search():
+    if ai.max_depth > EARLY_MOVE_DEPTH and ai.action[1] is not None:
+        robot.move_towards(ai.action[1])
+    return False
+
+
 while game.winner is None:
     hub.light_matrix.write(robot.cur_column)
     if game.turn == YELLOW:
         hub.status_light.on('yellow')
-        has_played = False
-        while not has_played:
-            wait_for_seconds(0.1)
-            if robot.left_color.get_color() == 'red':
-                robot.move(-1)
-            elif robot.right_color.get_color() == 'red':
-                robot.move(-1)
-            elif robot.mid_color.get_color() == 'red':
-                robot.apply_action(robot.cur_column)
-                game.apply_action(robot.cur_column)
-                has_played = True
+        robot.human_action = None
+        if COMPACT_SEARCH and PONDERING:
+            ai.ponder(robot.poll_sensors)
+        while robot.human_action is None:
+            wait_for_seconds(SENSOR_POLL_MS / 1000)
+            robot.poll_sensors()
+        robot.apply_action(robot.human_action)
+        game.apply_action(robot.human_action)
     else:
         hub.status_light.on('red')
-        ai_action = ai.get_action()
+        ai_action = ai.get_action(follow_search) if COMPACT_SEARCH else ai.get_action()
         robot.apply_action(ai_action)
         game.apply_action(ai_action)
 
 if game.winner == DRAW:
     print("Draw !")
 else:
-    print("Winner is {}".format('yellow' if game.winner['color'] == YELLOW else 'red'))
+    print("Winner is {}".format('yellow' if game.winner == YELLOW else 'red'))
@@ -0,0 +1,210 @@
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ai import TIMEOUT_TURN
+from constants import *
+from game import N_CELLS
+from move_ordering import CENTER_ORDER
+from numpy_bitboards import COLUMN_TOPS, connected_fours
+from solver import describe_outcome
+from time_manager import TimeManager
+
+BATCH_SIZE = 64  # Number of random games played at once from every new node
+EXPLORATION = 1.4
+TREE_SIZE = 1 << 16  # Maximum number of nodes, the search stops when the tree is full
+# Terminal state of a node, for the player who moved to it
+NOT_TERMINAL = 0
+TERMINAL_WIN = 1
+TERMINAL_DRAW = 2
+
+
+# Monte Carlo tree search with UCT. Every new node is evaluated by a batch of random games played in lock-step on
+# NumPy bitboards. The tree is stored in arrays indexed by node, node 0 is the root. Same interface as AI, the score of
+# action is the expected result from -100 (loss) to 100 (win), or a win score once a winning move is found.
+# nodes_explored counts the random games, so node_limit is a number of random games
+class MCTS:
+    def __init__(self, game, color, timeout=TIMEOUT_TURN, node_limit=math.inf, game_time=None, batch_size=BATCH_SIZE,
+                 exploration=EXPLORATION, tree_size=TREE_SIZE, seed=None):
+        if np is None:
+            raise ImportError("The MCTS engine requires numpy")
+        self.game = game
+        self.color = color
+        self.time_manager = TimeManager(timeout, game_time)
+        self.node_limit = node_limit
+        self.batch_size = batch_size
+        self.exploration = exploration
+        self.rng = np.random.default_rng(seed)
+        self.children = np.zeros((tree_size, SIZE_X), dtype=np.int32)  # Node of every action, 0 when not expanded
+        self.visits = np.zeros(tree_size, dtype=np.float64)
+        self.rewards = np.zeros(tree_size, dtype=np.float64)  # Sum of the results of the player who moved to the node
+        self.terminal = np.zeros(tree_size, dtype=np.int8)
+        self.n_nodes = 0
+        self.nodes_explored = 0
+        self.max_depth = 1
+        self.action = None
+        self.iterations = []
+        self.proven_outcome = None
+        self.listeners = []
+        self.parallel_search = None
+        self.stop_requested = False
+
+    def stop(self):
+        self.stop_requested = True
+
+    def clear_stop(self):
+        self.stop_requested = False
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    # depth_limit is accepted for compatibility with AI, the tree grows where the random games lead it
+    def get_action(self, depth_limit=None):
+        self.time_manager.start_turn(self.game)
+        try:
+            return self.search()
+        finally:
+            self.time_manager.end_turn()
+
+    def search(self):
+        start = time.time()
+        self.nodes_explored = 0
+        self.max_depth = 1
+        self.iterations = []
+        self.proven_outcome = None
+        self.n_nodes = 0
+        self.new_node()
+        while self.n_nodes < len(self.visits) and self.nodes_explored < self.node_limit and not self.stop_requested \
+                and (self.nodes_explored == 0 or time.time() < self.time_manager.soft_deadline):
+            self.simulate()
+
+        root_children = self.children[0]
+        if not root_children.any():  # No random game was played, the first legal action of the move orderer is played
+            self.action = 0, next(action for action in CENTER_ORDER if self.game.cur_depths[action] >= 0)
+        else:
+            best = max((child for child in root_children if child), key=lambda child: self.visits[child])
+            action = int(np.flatnonzero(root_children == best)[0])
+            if self.terminal[best] == TERMINAL_WIN:
+                self.action = WIN_SCORE - 1, action
+                self.proven_outcome = describe_outcome(self.action[0])
+            else:
+                self.action = round(200 * self.rewards[best] / self.visits[best]) - 100, action
+        self.end_search(start)
+        return self.action[1]
+
+    def new_node(self):
+        node = self.n_nodes
+        self.children[node] = 0
+        self.visits[node] = 0
+        self.rewards[node] = 0
+        if self.game.winner is None:
+            self.terminal[node] = NOT_TERMINAL
+        else:
+            self.terminal[node] = TERMINAL_DRAW if self.game.winner == DRAW else TERMINAL_WIN
+        self.n_nodes += 1
+        return node
+
+    # Selection, expansion, random games and backpropagation of one batch
+    def simulate(self):
+        path = [0]
+        node = 0
+        while not self.terminal[node]:
+            actions = [action for action in CENTER_ORDER if self.game.cur_depths[action] >= 0]
+            children = self.children[node, actions]
+            if not children.all():
+                action = actions[int(np.argmin(children))]  # First action not expanded yet
+                self.game.apply_action(action)
+                node = self.new_node()
+                self.children[path[-1], action] = node
+                path.append(node)
+                break
+            visits = self.visits[children]
+            scores = self.rewards[children] / visits + \
+                self.exploration * np.sqrt(math.log(self.visits[node]) / visits)
+            i = int(np.argmax(scores))
+            self.game.apply_action(actions[i])
+            node = int(children[i])
+            path.append(node)
+
+        n = self.batch_size
+        if self.terminal[node] == TERMINAL_WIN:
+            reward = n
+        elif self.terminal[node] == TERMINAL_DRAW:
+            reward = n / 2
+        else:
+            wins, draws = self.playouts(n)
+            reward = n - wins - draws / 2  # The player to move after node is the opponent of the one who moved to it
+        self.nodes_explored += n
+        self.max_depth = max(self.max_depth, len(path))
+        for node in reversed(path):
+            self.visits[node] += n
+            self.rewards[node] += reward
+            reward = n - reward
+        for _ in range(len(path) - 1):
+            self.game.undo_action()
+
+    # Plays n random games from the current position, returns the number of games won by the player to move and the
+    # number of draws
+    def playouts(self, n):
+        game = self.game
+        me = np.full(n, game.masks[game.turn], dtype=np.uint64)
+        opponent = np.full(n, game.masks[RED if game.turn == YELLOW else YELLOW], dtype=np.uint64)
+        heights = np.tile(np.array(game.heights, dtype=np.int64), (n, 1))
+        results = np.zeros(n, dtype=np.int8)  # 1 when the player to move wins, -1 when it loses, 0 for a draw
+        active = np.ones(n, dtype=bool)
+        rows = np.arange(n)
+        one = np.uint64(1)
+        sign = 1
+        # The games are played in lock-step so they all fill the board at the same move
+        for _ in range(N_CELLS - len(game.actions)):
+            legal = heights < COLUMN_TOPS
+            choices = np.argmax(self.rng.random((n, SIZE_X)) * legal, axis=1)  # Random legal column of every game
+            bits = heights[rows, choices]
+            me |= np.where(active, one << bits.astype(np.uint64), 0).astype(np.uint64)
+            heights[rows, choices] += 1
+            won = active & connected_fours(me)
+            results[won] = sign
+            active &= ~won
+            if not active.any():
+                break
+            me, opponent = opponent, me
+            sign = -sign
+        return int(np.count_nonzero(results == 1)), int(np.count_nonzero(results == 0))
+
+    # Most visited actions from the root
+    def principal_variation(self):
+        variation = []
+        node = 0
+        while not self.terminal[node] and self.children[node].any():
+            action = int(np.argmax(np.where(self.children[node] > 0, self.visits[self.children[node]], -1)))
+            variation.append(action)
+            node = int(self.children[node, action])
+        return variation
+
+    # A single iteration per turn, with the same keys as AI.end_iteration
+    def end_search(self, start):
+        now = time.time()
+        iteration = {
+            'depth': self.max_depth,
+            'score': self.action[0],
+            'action': self.action[1],
+            'nodes': self.nodes_explored,
+            'total_nodes': self.nodes_explored,
+            'tt_probes': 0,
+            'tt_hits': 0,
+            'beta_cutoffs': 0,
+            'first_move_cutoff_rate': None,
+            'time': now - start,
+            'elapsed': now - self.time_manager.turn_start_timestamp,
+            'principal_variation': self.principal_variation(),
+        }
+        self.iterations.append(iteration)
+        for listener in self.listeners:
+            listener(self, iteration)
@@ -0,0 +1,46 @@
+from constants import *
+
+CENTER_ORDER = sorted(range(SIZE_X), key=lambda x: abs(x - SIZE_X // 2))
+N_KILLERS = 2
+
+
+class MoveOrderer:
+    def __init__(self, use_table_action=True, use_killers=True, use_history=True, use_center=True):
+        self.use_table_action = use_table_action
+        self.use_killers = use_killers
+        self.use_history = use_history
+        self.static_order = CENTER_ORDER if use_center else list(range(SIZE_X))
+        self.killers = [[None] * N_KILLERS for _ in range(SIZE_X * SIZE_Y + 1)]  # Indexed by depth
+        self.history = [[0] * SIZE_X for _ in range(3)]  # Indexed by color then action
+
+    def new_search(self):
+        for killers in self.killers:
+            for i in range(N_KILLERS):
+                killers[i] = None
+        # Keep the history of the previous turns but give more weight to the new one
+        for color_history in self.history:
+            for action in range(SIZE_X):
+                color_history[action] //= 2
+
+    def order(self, game, depth, table_action):
+        actions = [action for action in self.static_order if game.cur_depths[action] >= 0]
+        if self.use_history:
+            actions.sort(key=self.history[game.turn].__getitem__, reverse=True)  # Stable, ties keep the static order
+        if self.use_killers:
+            for killer in reversed(self.killers[depth]):
+                if killer is not None and killer in actions:
+                    actions.remove(killer)
+                    actions.insert(0, killer)
+        if self.use_table_action and table_action is not None and table_action in actions:
+            actions.remove(table_action)
+            actions.insert(0, table_action)
+        return actions
+
+    def record_cutoff(self, game, depth, action, remaining_depth):
+        if self.use_killers:
+            killers = self.killers[depth]
+            if killers[0] != action:
+                killers[1:] = killers[:-1]
+                killers[0] = action
+        if self.use_history:
+            self.history[game.turn][action] += remaining_depth * remaining_depth
@@ -0,0 +1,23 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from constants import *
+from game import COLUMN_BITS, SHIFTS
+
+# Bitboards of the layout of Game.masks stored in NumPy arrays, one position per element. Only defined with numpy
+if np is not None:
+    COLUMN_TOPS = np.array([x * COLUMN_BITS + SIZE_Y for x in range(SIZE_X)], dtype=np.int64)  # Bit above each column
+    NP_SHIFTS = [(np.uint64(shift), np.uint64(2 * shift)) for shift in SHIFTS]
+else:
+    COLUMN_TOPS = NP_SHIFTS = None  # Importing works without numpy, the modules check for it before any use
+
+
+# Whether each of the bitboards contains 4 connected pieces
+def connected_fours(pieces):
+    found = np.zeros(len(pieces), dtype=bool)
+    for shift, double_shift in NP_SHIFTS:
+        m = pieces & (pieces >> shift)
+        found |= (m & (m >> double_shift)) != 0
+    return found
@@ -0,0 +1,103 @@
+import argparse
+import functools
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+
+from ai import AI
+from game import Game, mirror_action
+
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin')
+MAGIC = b'C4BOOK01'
+RECORD = struct.Struct('<QBh')  # Canonical position key, action, score for the player to move
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_BOOK_PATH):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"Not an opening book ! Path: {path}")
+        self.n_records = (len(self.data) - len(MAGIC)) // RECORD.size
+
+    def lookup(self, game):
+        key, mirrored = game.canonical_position_key()
+        lo, hi = 0, self.n_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, action, score = RECORD.unpack_from(self.data, len(MAGIC) + mid * RECORD.size)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return score, mirror_action(action) if mirrored else action
+        return None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.n_records
+
+
+def enumerate_positions(max_ply):
+    positions = []
+    seen = set()
+    frontier = [[]]
+    for ply in range(max_ply + 1):
+        next_frontier = []
+        for actions in frontier:
+            game = Game.from_actions(actions)
+            key, _ = game.canonical_position_key()
+            if key in seen:
+                continue
+            seen.add(key)
+            positions.append(actions)
+            if ply < max_ply:
+                for action in game.successors():
+                    game.apply_action(action)
+                    if game.winner is None:
+                        next_frontier.append(actions + [action])
+                    game.undo_action()
+        frontier = next_frontier
+    return positions
+
+
+def search_position(actions, depth):
+    game = Game.from_actions(actions)
+    ai = AI(game, game.turn, timeout=math.inf)
+    action = ai.get_action(depth_limit=depth)
+    key, mirrored = game.canonical_position_key()
+    return key, mirror_action(action) if mirrored else action, ai.action[0]
+
+
+def generate(path, max_ply, depth, workers):
+    positions = enumerate_positions(max_ply)
+    print(f"Searching {len(positions)} positions at depth {depth}")
+    records = []
+    with multiprocessing.Pool(workers) as pool:
+        for i, record in enumerate(pool.imap_unordered(functools.partial(search_position, depth=depth), positions, chunksize=8)):
+            records.append(record)
+            if (i + 1) % 100 == 0:
+                print(f"{i + 1}/{len(positions)}")
+    records.sort()
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for record in records:
+            f.write(RECORD.pack(*record))
+    print(f"Wrote {len(records)} positions to {path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate the opening book")
+    parser.add_argument('--ply', type=int, default=4, help="Number of moves played in the deepest stored positions")
+    parser.add_argument('--depth', type=int, default=12, help="Search depth used for every position")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default=DEFAULT_BOOK_PATH)
+    args = parser.parse_args()
+    generate(args.output, args.ply, args.depth, args.workers)
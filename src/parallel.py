@@ -0,0 +1,142 @@
+import argparse
+import math
+import multiprocessing
+import os
+import time
+
+from constants import *
+from game import Game, format_moves
+from move_ordering import CENTER_ORDER
+from transposition import value_from_table
+
+STOP_CHECK_INTERVAL = 0.05  # Seconds between two checks of the stop callback while the workers search
+
+# One AI per color and per worker process, so that its transposition table stays warm between turns
+_worker_ais = {}
+
+
+def _worker_ai(color):
+    from ai import AI
+    if color not in _worker_ais:
+        _worker_ais[color] = AI(Game(), color, endgame_empty_cells=0)
+    return _worker_ais[color]
+
+
+# Searches the position reached after root_action at a single depth, returns its value or None when the deadline or
+# the node limit is reached first. depth 1 starts a new search from the root
+def search_root_action(actions, color, root_action, deadline, depth, node_limit=math.inf):
+    ai = _worker_ai(color)
+    ai.game = Game.from_actions(actions + [root_action])
+    ai.time_manager.set_deadline(deadline)
+    ai.node_limit = node_limit
+    ai.nodes_explored = 0
+    ai.next_check = 0
+    if depth == 1:
+        ai.transposition_table.new_search()
+        ai.move_orderer.new_search()
+    if ai.game.winner:
+        return root_action, value_from_table(ai.evaluate(0), 1), True, 1
+    empty_cells = sum(ai.game.cur_depths) + SIZE_X
+    ai.max_depth = min(depth, empty_cells)
+    try:
+        value, _ = ai.minimax(-100000, 100000, 0)
+    except TimeoutError:
+        return root_action, None, False, ai.nodes_explored
+    # The values are one ply deeper from the real root
+    return root_action, value_from_table(value, 1), depth >= empty_cells, ai.nodes_explored
+
+
+# Root splitting: every root action is searched by its own worker, one depth at a time so that all the root actions
+# reach the same depth before the next one starts. The node limit is shared evenly between the root actions of a depth,
+# and stop is called while the workers search: when it returns True the workers are terminated and the search returns
+# the values of the last completed depth
+class ParallelSearch:
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+
+    def search(self, game, color, deadline, depth_limit=None, node_limit=math.inf, stop=None):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        values = {}  # Root action -> value at the deepest depth completed by every root action
+        complete = set()  # Root actions searched until the end of the game
+        nodes_explored = 0
+        max_depth = sum(game.cur_depths) + SIZE_X - 1
+        if depth_limit is not None:
+            max_depth = min(max_depth, max(depth_limit - 1, 1))
+        depth = 0
+        while depth < max_depth:
+            if depth > 0 and (time.time() >= deadline or nodes_explored >= node_limit or len(complete) == len(values)):
+                break
+            actions = [action for action in CENTER_ORDER if game.cur_depths[action] >= 0 and action not in complete]
+            # Depth 1 is always completed so that every root action has a value, unless the search is stopped
+            if depth == 0:
+                task_deadline, task_nodes = math.inf, math.inf
+            else:
+                task_deadline = deadline
+                task_nodes = math.inf if node_limit == math.inf else (node_limit - nodes_explored) // len(actions)
+            tasks = [(list(game.actions), color, action, task_deadline, depth + 1, task_nodes) for action in actions]
+            pending = self.pool.starmap_async(search_root_action, tasks)
+            while not pending.ready():
+                pending.wait(STOP_CHECK_INTERVAL)
+                if stop is not None and stop() and not pending.ready():
+                    self.terminate()
+                    break
+            if self.pool is None:
+                break
+            results = pending.get()
+            nodes_explored += sum(result[3] for result in results)
+            if any(value is None for _, value, _, _ in results):
+                break
+            for action, value, action_complete, _ in results:
+                values[action] = value
+                if action_complete:
+                    complete.add(action)
+            depth += 1
+        best = None
+        for action in CENTER_ORDER:  # Ties are broken like the static order of the sequential search
+            if action in values and (best is None or values[action] > best[0]):
+                best = values[action], action
+        return best, depth + 1, nodes_explored  # depth + 1 is the depth reached from the root
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    # The workers can't be interrupted in the middle of a task, the next search starts a new pool
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = None
+
+
+def speedup_report(positions, depth, workers):
+    from ai import AI
+    print(f"{'position':<16}{'1 core':>10}{f'{workers} cores':>10}{'speedup':>10}")
+    parallel_search = ParallelSearch(workers)
+    total_single, total_parallel = 0, 0
+    for moves in positions:
+        game = Game.from_actions(moves)
+        ai = AI(game, game.turn, timeout=math.inf, endgame_empty_cells=0)
+        start = time.time()
+        ai.get_action(depth_limit=depth)
+        single = time.time() - start
+        start = time.time()
+        parallel_search.search(game, game.turn, math.inf, depth)
+        parallel = time.time() - start
+        total_single += single
+        total_parallel += parallel
+        name = format_moves(moves) or '-'
+        print(f"{name:<16}{single:>9.2f}s{parallel:>9.2f}s{single / parallel:>9.2f}x")
+    print(f"{'total':<16}{total_single:>9.2f}s{total_parallel:>9.2f}s{total_single / total_parallel:>9.2f}x")
+    parallel_search.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the parallel search with a single core at a fixed depth")
+    parser.add_argument('--depth', type=int, default=9)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    speedup_report(([], [3, 3, 2], [3, 2, 3, 3, 4, 1], [3, 3, 3, 3, 2, 4, 1]), args.depth, args.workers)
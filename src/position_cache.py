@@ -0,0 +1,92 @@
+import fcntl
+import mmap
+import os
+import struct
+
+from game import mirror_action
+from transposition import EXACT
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'position_cache.bin')
+DEFAULT_CAPACITY = 1 << 20  # Number of records, 17 MB
+MIN_DEPTH = 8  # Shallower results are cheaper to search again than to store
+MAGIC = b'C4CACHE1'
+HEADER = struct.Struct('<8sII')  # Magic, capacity, number of writes
+RECORD = struct.Struct('<QIhBBB')  # Position key, write number, score for the player to move, depth, flag, action
+BUCKET_SIZE = 4  # A position can be stored in any of the records of its bucket
+NO_ACTION = 255
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+# Search results shared by every process using the same file, a position and its mirror share the same record. The
+# file has a fixed number of records, when the bucket of a position is full the shallowest and oldest record is
+# replaced. Readers take a shared lock and writers an exclusive one, so that no record is ever read half written
+class PositionCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, capacity=DEFAULT_CAPACITY, min_depth=MIN_DEPTH):
+        self.min_depth = min_depth
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size == 0:
+                capacity -= capacity % BUCKET_SIZE
+                os.ftruncate(self.fd, HEADER.size + capacity * RECORD.size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, capacity, 0), 0)
+            self.data = mmap.mmap(self.fd, 0)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        magic, self.capacity, _ = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a position cache ! Path: {path}")
+        self.n_buckets = self.capacity // BUCKET_SIZE
+
+    def bucket_offset(self, key):
+        bucket = ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) % self.n_buckets
+        return HEADER.size + bucket * BUCKET_SIZE * RECORD.size
+
+    # Returns (depth, score, flag, action) with the score for the player to move, or None
+    def lookup(self, game):
+        key, mirrored = game.canonical_position_key()
+        offset = self.bucket_offset(key)
+        fcntl.flock(self.fd, fcntl.LOCK_SH)
+        try:
+            for i in range(BUCKET_SIZE):
+                record_key, _, score, depth, flag, action = RECORD.unpack_from(self.data, offset + i * RECORD.size)
+                if record_key == key:
+                    if action == NO_ACTION:
+                        return depth, score, flag, None
+                    return depth, score, flag, mirror_action(action) if mirrored else action
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return None
+
+    def store(self, game, depth, score, flag=EXACT, action=None):
+        if depth < self.min_depth:
+            return
+        key, mirrored = game.canonical_position_key()
+        if mirrored and action is not None:
+            action = mirror_action(action)
+        offset = self.bucket_offset(key)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            _, _, n_writes = HEADER.unpack_from(self.data, 0)
+            replaced = None
+            for i in range(BUCKET_SIZE):
+                record_offset = offset + i * RECORD.size
+                record_key, written, _, record_depth, _, _ = RECORD.unpack_from(self.data, record_offset)
+                if record_key == key:
+                    if record_depth > depth:
+                        return  # Another process already stored a deeper result
+                    replaced = record_offset
+                    break
+                rank = (record_depth, written) if record_key else (-1, 0)
+                if replaced is None or rank < replaced_rank:
+                    replaced, replaced_rank = record_offset, rank
+            RECORD.pack_into(self.data, replaced, key, n_writes, score, depth, flag,
+                             NO_ACTION if action is None else action)
+            HEADER.pack_into(self.data, 0, MAGIC, self.capacity, (n_writes + 1) & 0xFFFFFFFF)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self.data.close()
+        os.close(self.fd)
@@ -0,0 +1,58 @@
+import threading
+
+from game import Game
+
+
+# Runs AI.get_action in a background thread on a copy of the game, so that the caller keeps running meanwhile.
+# Progress can be followed with ai.iterations while the search is running
+class SearchWorker:
+    def __init__(self, ai):
+        self.ai = ai
+        self.thread = None
+        self.action = None
+        self.cancelled = False
+        self.pondering = False
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, game):
+        self.run_thread(game, self.search)
+
+    # Searches on the opponent's time until cancel() or start() is called
+    def start_pondering(self, game):
+        self.run_thread(game, self.ai.ponder)
+        self.pondering = True
+
+    def run_thread(self, game, target):
+        self.cancel()
+        self.action = None
+        self.cancelled = False
+        self.ai.clear_stop()
+        self.ai.game = Game.from_actions(game.actions)
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+
+    def search(self):
+        action = self.ai.get_action()
+        if not self.cancelled:
+            self.action = action
+
+    # Returns the action once the search is over, None before that
+    def poll(self):
+        if self.thread is None or self.running or self.pondering:
+            return None
+        self.thread = None
+        action, self.action = self.action, None
+        return action
+
+    def cancel(self):
+        if self.thread is None:
+            return
+        self.cancelled = True
+        self.ai.stop()
+        self.thread.join()
+        self.thread = None
+        self.action = None
+        self.pondering = False
@@ -0,0 +1,171 @@
+import argparse
+import math
+import os
+import socket
+import sys
+import threading
+import time
+
+from ai import AI, TIMEOUT_TURN
+from constants import *
+from game import Game, format_moves, parse_moves
+from opening_book import DEFAULT_BOOK_PATH, OpeningBook
+from position_cache import PositionCache
+from time_manager import TimeManager
+
+GO_LIMITS = {'depth': int, 'nodes': int, 'time': float}
+
+
+# Line protocol around a long-lived engine, the transposition tables and the opening book stay loaded between
+# requests. Commands:
+#   position [moves]                          moves as a string of 1-based columns, the empty board without moves
+#   go [depth N] [nodes N] [time SECONDS]     answers 'info' lines for every iteration then 'bestmove'
+#   stop                                      ends the current search, which answers 'bestmove' right away
+#   stats                                     counters of the engine
+#   quit
+# Except stop and quit, a command received during a search waits for the end of the search
+class EngineServer:
+    def __init__(self, opening_book=None, position_cache=None):
+        self.opening_book = opening_book
+        self.position_cache = position_cache
+        self.game = Game()
+        self.ais = {}  # One AI per color, the scores of their tables are from their own point of view
+        self.output = None
+        self.output_lock = threading.Lock()
+        self.thread = None
+        self.searches = 0
+        self.total_nodes = 0
+        self.total_time = 0
+
+    def get_ai(self, color):
+        if color not in self.ais:
+            ai = AI(Game(), color, opening_book=self.opening_book, position_cache=self.position_cache)
+            ai.add_listener(self.send_info)
+            self.ais[color] = ai
+        return self.ais[color]
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def send_info(self, ai, iteration):
+        self.send(f"info depth {iteration['depth']} score {iteration['score']} nodes {iteration['total_nodes']} "
+                  f"time {int(iteration['elapsed'] * 1000)} pv {format_moves(iteration['principal_variation'])}")
+
+    @property
+    def searching(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def position(self, args):
+        if len(args) > 1:
+            raise ValueError("Expected a single move string")
+        self.game = Game.from_actions(parse_moves(args[0] if args else ''))
+
+    def go(self, args):
+        if self.game.winner is not None:
+            raise ValueError("The game is over")
+        if len(args) % 2:
+            raise ValueError("Expected pairs of limit name and value")
+        limits = {}
+        for name, value in zip(args[::2], args[1::2]):
+            if name not in GO_LIMITS:
+                raise ValueError(f"Unknown limit ! Limit: {name}")
+            limits[name] = GO_LIMITS[name](value)
+        if limits.get('depth', 1) < 1:
+            raise ValueError(f"Invalid depth ! Depth: {limits['depth']}")
+        ai = self.get_ai(self.game.turn)
+        ai.game = Game.from_actions(self.game.actions)
+        if 'time' in limits:
+            ai.time_manager = TimeManager(limits['time'], exact=True)
+        elif limits:
+            ai.time_manager = TimeManager(math.inf)  # Depth or nodes only
+        else:
+            ai.time_manager = TimeManager(TIMEOUT_TURN)
+        ai.node_limit = limits.get('nodes', math.inf)
+        ai.clear_stop()
+        self.thread = threading.Thread(target=self.search, args=(ai, limits.get('depth')), daemon=True)
+        self.thread.start()
+
+    def search(self, ai, depth_limit):
+        start = time.time()
+        action = ai.get_action(depth_limit)
+        self.searches += 1
+        self.total_nodes += ai.nodes_explored
+        self.total_time += time.time() - start
+        self.send(f"bestmove {action + 1} score {ai.action[0]}")
+
+    def stop(self):
+        if self.searching:
+            for ai in self.ais.values():
+                ai.stop()
+            self.thread.join()
+
+    def stats(self):
+        tables = ' '.join(f"{'yellow' if color == YELLOW else 'red'} {ai.transposition_table.used()}"
+                          for color, ai in sorted(self.ais.items()))
+        nodes_per_second = self.total_nodes / self.total_time if self.total_time else 0
+        self.send(f"stats searches {self.searches} nodes {self.total_nodes} nps {nodes_per_second:.0f} "
+                  f"book {len(self.opening_book) if self.opening_book is not None else 0} tables {tables or '-'}")
+
+    # Returns False once the session is over
+    def handle(self, line):
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        try:
+            if command == 'quit':
+                return False
+            if command == 'stop':
+                self.stop()
+                return True
+            if self.thread is not None:
+                self.thread.join()
+            if command == 'position':
+                self.position(args)
+            elif command == 'go':
+                self.go(args)
+            elif command == 'stats':
+                self.stats()
+            else:
+                raise ValueError(f"Unknown command ! Command: {command}")
+        except ValueError as e:
+            self.send(f"error {e}")
+        return True
+
+    def serve(self, input, output):
+        self.output = output
+        try:
+            for line in input:
+                if not self.handle(line):
+                    break
+        finally:
+            self.stop()
+
+
+def serve_socket(server, port):
+    with socket.create_server(('127.0.0.1', port)) as listener:
+        print(f"Listening on 127.0.0.1:{port}", file=sys.stderr)
+        while True:
+            connection, _ = listener.accept()
+            with connection, connection.makefile('r') as input, connection.makefile('w') as output:
+                try:
+                    server.serve(input, output)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Engine answering a line protocol on stdin/stdout or a local socket")
+    parser.add_argument('--port', type=int, default=None, help="Serves one client at a time on this local port")
+    parser.add_argument('--book', default=DEFAULT_BOOK_PATH, help="Opening book, used when the file exists")
+    parser.add_argument('--cache', default=None, help="Position cache file, shared with other processes")
+    args = parser.parse_args()
+
+    server = EngineServer(OpeningBook(args.book) if os.path.exists(args.book) else None,
+                          PositionCache(args.cache) if args.cache else None)
+    if args.port is None:
+        server.serve(sys.stdin, sys.stdout)
+    else:
+        serve_socket(server, args.port)
@@ -0,0 +1,140 @@
+import time
+
+from constants import *
+from game import N_CELLS, winning_cells
+from move_ordering import CENTER_ORDER
+from tactics import tactical_moves
+from transposition import EXACT, LOWER, UPPER, TranspositionTable, value_from_table, value_to_table
+
+SOLVER_TABLE_SIZE = 1 << 18
+TIME_CHECK_INTERVAL = 1024  # Number of nodes between two clock checks
+
+
+def describe_outcome(score):
+    if score == 0:
+        return {'outcome': 'draw', 'distance': None}
+    return {'outcome': 'win' if score > 0 else 'loss', 'distance': WIN_SCORE - abs(score)}
+
+
+# Exact solver: scores are WIN_SCORE - n when the player to move at the root wins with its n-th move from the root
+# (counted in plies, like AI.evaluate), -WIN_SCORE + n when it loses and 0 for a draw
+class Solver:
+    def __init__(self, table_size=SOLVER_TABLE_SIZE):
+        self.transposition_table = TranspositionTable(table_size)
+        self.game = None
+        self.nodes_explored = 0
+        self.deadline = None
+        self.stop_requested = False
+
+    # Null-window friendly negamax, the score is from the point of view of the player to move
+    def negamax(self, alpha, beta, depth):
+        self.nodes_explored += 1
+        if self.nodes_explored % TIME_CHECK_INTERVAL == 0 and \
+                (self.stop_requested or (self.deadline is not None and time.time() > self.deadline)):
+            for _ in range(depth):
+                self.game.undo_action()
+            raise TimeoutError
+        game = self.game
+        if game.winner is not None:
+            return 0 if game.winner == DRAW else -WIN_SCORE + depth
+
+        winning_action, candidates = tactical_moves(game)
+        if winning_action is not None:
+            return WIN_SCORE - depth - 1
+        if len(game.actions) == N_CELLS - 1:
+            return 0  # The last move cannot win, otherwise it would have been found above
+        if not candidates:
+            return -WIN_SCORE + depth + 2  # Every move lets the opponent win next move
+
+        # The player to move cannot win before its second move from now
+        max_score = WIN_SCORE - depth - 3
+        if beta > max_score:
+            beta = max_score
+            if alpha >= beta:
+                return beta
+
+        key, mirrored = game.canonical_key()
+        entry = self.transposition_table.probe(key, mirrored)
+        entry_action = None
+        if entry is not None:
+            _, entry_value, flag, entry_action = entry
+            entry_value = value_from_table(entry_value, depth)
+            if flag == EXACT:
+                return entry_value
+            if flag == LOWER and entry_value > alpha:
+                alpha = entry_value
+            elif flag == UPPER and entry_value < beta:
+                beta = entry_value
+            if alpha >= beta:
+                return entry_value
+
+        me = game.masks[game.turn]
+        mask = me | game.masks[RED if game.turn == YELLOW else YELLOW]
+        actions = self.order(game, me, mask, candidates, entry_action)
+        alpha_orig = alpha
+        best_value = -WIN_SCORE
+        best_action = None
+        for action in actions:
+            game.apply_action(action)
+            value = -self.negamax(-beta, -alpha, depth + 1)
+            game.undo_action()
+            if value > best_value:
+                best_value = value
+                best_action = action
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        if best_value <= alpha_orig:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.transposition_table.store(key, N_CELLS, value_to_table(best_value, depth), flag, best_action, mirrored)
+        return best_value
+
+    # Moves creating the most new winning cells first, then the table action and the center columns
+    @staticmethod
+    def order(game, me, mask, candidates, entry_action):
+        scored_actions = []
+        for action in CENTER_ORDER:
+            move = 1 << game.heights[action]
+            if candidates & move:
+                threats = bin(winning_cells(me | move, mask | move)).count('1')
+                scored_actions.append((action == entry_action, threats, action))
+        scored_actions.sort(key=lambda scored_action: scored_action[:2], reverse=True)
+        return [action for _, _, action in scored_actions]
+
+    def solve(self, game, timeout=None):
+        self.game = game
+        self.nodes_explored = 0
+        self.deadline = None if timeout is None else time.time() + timeout
+        self.transposition_table.new_search()
+
+        # MTD-like bisection of the score with null-window searches, the first probe is the win/draw/loss boundary
+        min_score, max_score = -WIN_SCORE, WIN_SCORE
+        while min_score < max_score:
+            med = min_score + (max_score - min_score) // 2
+            if min_score < 0 < max_score:
+                med = 0
+            value = self.negamax(med, med + 1, 0)
+            if value <= med:
+                max_score = value
+            else:
+                min_score = value
+        score = min_score
+
+        # Find a move that reaches the score
+        best_action = None
+        for action in CENTER_ORDER:
+            if game.cur_depths[action] < 0:
+                continue
+            game.apply_action(action)
+            value = -self.negamax(-score, -score + 1, 1)
+            game.undo_action()
+            if best_action is None or value >= score:
+                best_action = action
+                if value >= score:
+                    break
+        return score, best_action
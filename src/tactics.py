@@ -0,0 +1,58 @@
+from constants import *
+from game import BOARD_MASK, BOTTOM_MASK, COLUMN_BITS, winning_cells
+
+# Rows 1, 3 and 5 counted from the bottom. When the board fills up the first player ends up playing on the odd rows and
+# the second player on the even ones, so these are the rows where the threats of each player can be cashed in
+ODD_ROWS_MASK = BOTTOM_MASK * sum(1 << h for h in range(0, SIZE_Y, 2))
+EVEN_ROWS_MASK = BOARD_MASK ^ ODD_ROWS_MASK
+GOOD_ROWS_MASKS = {YELLOW: ODD_ROWS_MASK, RED: EVEN_ROWS_MASK}
+
+
+def bit_column(bit):
+    return (bit.bit_length() - 1) // COLUMN_BITS
+
+
+# Tactics of the player to move, one ply deep. Returns (winning_action, cells): winning_action is a move that wins at
+# once or None, cells are the playable cells of the moves that don't let the opponent win on the next move: the block
+# when the opponent threatens to win, and never a move just below a cell that wins for the opponent. cells is 0 when
+# every move loses on the next turn
+def tactical_moves(game):
+    me = game.masks[game.turn]
+    opponent = game.masks[RED if game.turn == YELLOW else YELLOW]
+    mask = me | opponent
+    playable = (mask + BOTTOM_MASK) & BOARD_MASK
+    wins = winning_cells(me, mask) & playable
+    if wins:
+        return bit_column(wins & -wins), 0
+    opponent_wins = winning_cells(opponent, mask)
+    forced = opponent_wins & playable
+    if forced:
+        if forced & (forced - 1):
+            return None, 0  # Two threats, only one can be blocked
+        playable = forced
+    return None, playable & ~(opponent_wins >> 1)
+
+
+# Odd/even threat analysis: the new winning cells a move creates for the player to move, those on its own rows count
+# double, and a move just below one of its own winning cells lets the opponent block it
+def threat_rank(me, mask, threats, good_rows, move):
+    new_threats = winning_cells(me | move, mask | move) & ~threats
+    rank = bin(new_threats).count('1') + bin(new_threats & good_rows).count('1')
+    if threats & (move << 1):
+        rank -= 2
+    return rank
+
+
+# The actions of the move orderer whose cell is in cells. With rank, the first one is kept first and the others are
+# sorted by threat rank, ties keep the order of the move orderer
+def order_tactically(game, ordered_actions, cells, rank=False):
+    heights = game.heights
+    ordered_actions = [action for action in ordered_actions if cells >> heights[action] & 1]
+    if rank and len(ordered_actions) > 2:
+        me = game.masks[game.turn]
+        mask = me | game.masks[RED if game.turn == YELLOW else YELLOW]
+        threats = winning_cells(me, mask)
+        good_rows = GOOD_ROWS_MASKS[game.turn]
+        ordered_actions[1:] = sorted(ordered_actions[1:], key=lambda action: -threat_rank(
+            me, mask, threats, good_rows, 1 << heights[action]))
+    return ordered_actions
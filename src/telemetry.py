@@ -0,0 +1,30 @@
+import json
+
+from game import format_moves
+
+
+def iteration_record(context, iteration):
+    record = dict(context)
+    record.update(iteration)
+    record['principal_variation'] = format_moves(iteration['principal_variation'])
+    return record
+
+
+# AI listener writing every iteration as a JSON line, context is added to every line
+class JsonLinesLogger:
+    def __init__(self, output, **context):
+        self.output = output
+        self.context = context
+
+    def __call__(self, ai, iteration):
+        self.output.write(json.dumps(iteration_record(self.context, iteration)) + '\n')
+
+
+# AI listener keeping the iterations in memory, to send them from a worker process for example
+class IterationRecorder:
+    def __init__(self, **context):
+        self.context = context
+        self.records = []
+
+    def __call__(self, ai, iteration):
+        self.records.append(iteration_record(self.context, iteration))
@@ -0,0 +1,87 @@
+import math
+import time
+
+from constants import *
+from game import N_CELLS
+from tactics import tactical_moves
+
+CHECK_INTERVAL = 1024  # Number of nodes between two clock checks
+HARD_LIMIT_FACTOR = 2  # The hard limit of a turn is this many times its soft limit
+FORCED_MOVE_FACTOR = 0.05  # Share of the budget used when there is only one reasonable move
+MIN_MOVES_TO_GO = 6  # Never plan the game clock over less moves than that
+MIN_BRANCHING_FACTOR = 1.5
+MAX_BRANCHING_FACTOR = 8
+# Share of the budget by number of pieces already played: openings are known and endgames are short, the time is
+# better spent in between where most games are decided
+PHASE_FACTORS = ((8, 0.6), (28, 1.4), (N_CELLS, 0.8))
+
+
+def phase_factor(n_played):
+    for max_played, factor in PHASE_FACTORS:
+        if n_played < max_played:
+            return factor
+    return PHASE_FACTORS[-1][1]
+
+
+# True when the player to move has a winning move, or at most one move that doesn't let the opponent win at once: a
+# single legal move, a single threat to block or a single safe move
+def is_forced(game):
+    winning_action, cells = tactical_moves(game)
+    return winning_action is not None or not cells & (cells - 1)
+
+
+class TimeManager:
+    def __init__(self, move_time, game_time=None, exact=False):
+        self.move_time = move_time  # Average time of a turn
+        self.game_time = game_time  # Time left on the clock for the rest of the game, None when there is no clock
+        self.exact = exact  # Every turn is given move_time, whatever the position
+        self.turn_start_timestamp = 0
+        self.soft_deadline = math.inf
+        self.hard_deadline = math.inf
+
+    def start_turn(self, game):
+        if self.exact:
+            self.set_deadline(time.time() + self.move_time)
+            return
+        self.turn_start_timestamp = time.time()
+        if self.game_time is not None:
+            moves_to_go = max((N_CELLS - len(game.actions) + 1) // 2, MIN_MOVES_TO_GO)
+            budget = min(self.game_time / moves_to_go, self.move_time)
+        else:
+            budget = self.move_time
+        budget *= FORCED_MOVE_FACTOR if is_forced(game) else phase_factor(len(game.actions))
+        hard_budget = budget * HARD_LIMIT_FACTOR
+        if self.game_time is not None:
+            hard_budget = min(hard_budget, self.game_time / 2)
+        self.soft_deadline = self.turn_start_timestamp + budget
+        self.hard_deadline = self.turn_start_timestamp + hard_budget
+
+    # Both limits at the same time, when the caller manages the budget itself
+    def set_deadline(self, deadline):
+        self.turn_start_timestamp = time.time()
+        self.soft_deadline = self.hard_deadline = deadline
+
+    def end_turn(self):
+        if self.game_time is not None:
+            self.game_time -= time.time() - self.turn_start_timestamp
+
+    def hard_limit_reached(self):
+        return time.time() > self.hard_deadline
+
+    # An iteration is only started when it is predicted to end before the hard limit. iterations are the statistics
+    # recorded by AI.end_iteration
+    def can_start_iteration(self, iterations):
+        now = time.time()
+        if now >= self.soft_deadline:
+            return False
+        if not iterations:
+            return True
+        last = iterations[-1]
+        if abs(last['score']) > MATE_THRESHOLD:
+            return False  # A win or a loss is proven, searching deeper won't change it
+        if len(iterations) >= 2 and iterations[-2]['time'] > 0:
+            branching_factor = last['time'] / iterations[-2]['time']
+            branching_factor = min(max(branching_factor, MIN_BRANCHING_FACTOR), MAX_BRANCHING_FACTOR)
+        else:
+            branching_factor = MAX_BRANCHING_FACTOR
+        return now + last['time'] * branching_factor < self.hard_deadline
@@ -0,0 +1,73 @@
+from constants import *
+from game import mirror_action
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+# Mate scores depend on the distance from the root, they are stored relative to the node in the table
+def value_to_table(value, depth):
+    if value > MATE_THRESHOLD:
+        return value + depth
+    if value < -MATE_THRESHOLD:
+        return value - depth
+    return value
+
+
+def value_from_table(value, depth):
+    if value > MATE_THRESHOLD:
+        return value - depth
+    if value < -MATE_THRESHOLD:
+        return value + depth
+    return value
+
+
+class TranspositionTable:
+    def __init__(self, size):
+        if size & (size - 1):
+            raise ValueError(f"The table size must be a power of 2 ! Size: {size}")
+        self.size = size
+        self.index_mask = size - 1
+        self.keys = [None] * size
+        self.depths = [0] * size
+        self.values = [0] * size
+        self.flags = [EXACT] * size
+        self.actions = [None] * size
+        self.generations = [0] * size
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    # mirrored is the second value of Game.canonical_key, the action is mirrored back for the position searched
+    def probe(self, key, mirrored=False):
+        i = key & self.index_mask
+        if self.keys[i] == key:
+            action = self.actions[i]
+            if mirrored and action is not None:
+                action = mirror_action(action)
+            return self.depths[i], self.values[i], self.flags[i], action
+        return None
+
+    def store(self, key, depth, value, flag, action, mirrored=False):
+        if mirrored and action is not None:
+            action = mirror_action(action)
+        i = key & self.index_mask
+        # Depth-preferred replacement: a deeper entry of the current search is only overwritten by the same position
+        if self.keys[i] != key and self.generations[i] == self.generation and self.depths[i] > depth:
+            return
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.values[i] = value
+        self.flags[i] = flag
+        self.actions[i] = action
+        self.generations[i] = self.generation
+
+    def used(self):
+        return self.size - self.keys.count(None)
+
+    def clear(self):
+        for i in range(self.size):
+            self.keys[i] = None
+        self.generation = 0
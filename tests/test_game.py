@@ -0,0 +1,77 @@
+import random
+
+from ai import evaluate_game
+from constants import *
+from game import COLUMN_BITS, Game, mirror, mirror_action, score_lines
+from transposition import EXACT, TranspositionTable
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+# Lines score counted cell by cell on the grid, independently of the bitboards
+def reference_score(pieces):
+    def has_piece(x, h):
+        return 0 <= x < SIZE_X and 0 <= h < SIZE_Y and pieces >> (x * COLUMN_BITS + h) & 1
+
+    score = 0
+    for x in range(SIZE_X):
+        for h in range(SIZE_Y):
+            for dx, dh in DIRECTIONS:
+                if not has_piece(x, h) or has_piece(x - dx, h - dh):
+                    continue  # Only the first piece of every line is counted
+                length = 1
+                while has_piece(x + length * dx, h + length * dh):
+                    length += 1
+                score += SCORES_FOR_LINES.get(length, 0)
+    return score
+
+
+def check_scores(game, full_game):
+    for color in (YELLOW, RED):
+        assert game.scores[color] == score_lines(game.masks[color]) == reference_score(game.masks[color])
+        assert evaluate_game(game, color, 0) == evaluate_game(full_game, color, 0)
+
+
+# Random games where some moves are undone, the incremental scores have to match a full scan after every move
+def test_incremental_scores_match_full_scan():
+    rng = random.Random(0)
+    for _ in range(200):
+        game = Game()
+        full_game = Game(incremental_evaluation=False)
+        while game.winner is None:
+            if game.actions and rng.random() < 0.3:
+                game.undo_action()
+                full_game.undo_action()
+            else:
+                action = rng.choice(sorted(game.successors()))
+                game.apply_action(action)
+                full_game.apply_action(action)
+            check_scores(game, full_game)
+        while game.actions:
+            game.undo_action()
+            full_game.undo_action()
+            check_scores(game, full_game)
+        assert game.scores == [0, 0, 0]
+
+
+# The same random game played on the board and on its mirror, the positions of both games are mirrors of each other
+# after every move
+def test_canonical_keys_match_the_mirrored_game():
+    rng = random.Random(1)
+    table = TranspositionTable(1 << 10)
+    for _ in range(50):
+        game, mirrored_game = Game(), Game()
+        while game.winner is None:
+            action = rng.choice(sorted(game.successors()))
+            game.apply_action(action)
+            mirrored_game.apply_action(mirror_action(action))
+            assert game.mirror_key == mirrored_game.key and game.key == mirrored_game.mirror_key
+            key, mirrored = game.canonical_key()
+            assert mirrored_game.canonical_key() == (key, mirrored != (game.key != game.mirror_key))
+            assert mirror(game.position_key()) == mirrored_game.position_key()
+            assert game.canonical_position_key()[0] == mirrored_game.canonical_position_key()[0]
+            # An action stored from one side of the mirror is read back mirrored from the other side, unless the
+            # position is symmetric
+            table.store(key, 1, 0, EXACT, action, mirrored)
+            expected = action if game.key == game.mirror_key else mirror_action(action)
+            assert table.probe(*mirrored_game.canonical_key())[3] == expected
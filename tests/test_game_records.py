@@ -0,0 +1,47 @@
+import os
+
+from constants import *
+from game_records import INDEX_SUFFIX, GameRecords, GameRecordWriter, read_records, replay_games
+
+GAMES = [
+    ([3, 2, 3, 2, 3, 2, 3], YELLOW, None),
+    ([], EMPTY, None),
+    ([0, 6, 1, 5, 2], EMPTY, [(1, 2, 30), (-4, 5, 600), (0, 1, 70000), (-0x8000, 0, 0), (WIN_SCORE, 255, 1)]),
+]
+
+
+def write_games(path, games):
+    writer = GameRecordWriter(path)
+    for actions, result, stats in games:
+        writer.write(actions, result, stats)
+    writer.close()
+
+
+def check_records(path, games):
+    expected = [{'actions': actions, 'result': result, 'stats': stats} for actions, result, stats in games]
+    assert list(read_records(path)) == expected
+    records = GameRecords(path)
+    assert len(records) == len(games)
+    assert [records[n] for n in range(len(records))] == expected
+    records.close()
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / 'games.c4r')
+    write_games(path, GAMES)
+    check_records(path, GAMES)
+    write_games(path, GAMES[:1])  # Appended to the same file
+    check_records(path, GAMES + GAMES[:1])
+    game, record = next(replay_games(path))
+    assert game.winner['color'] == YELLOW and game.actions == record['actions']
+
+
+def test_index_is_rebuilt(tmp_path):
+    path = str(tmp_path / 'games.c4r')
+    write_games(path, GAMES[:2])
+    os.remove(path + INDEX_SUFFIX)
+    write_games(path, GAMES[2:])  # The writer has to index the records written before the index was lost
+    check_records(path, GAMES)
+    with open(path + INDEX_SUFFIX, 'r+b') as f:
+        f.truncate(8)  # Only the first record left in the index
+    check_records(path, GAMES)
@@ -0,0 +1,44 @@
+import random
+
+from constants import *
+from game import N_CELLS, Game
+from solver import Solver
+
+EMPTY_CELLS = 8  # Small enough for the brute force search
+
+
+# Score of the player to move with the convention of the solver, every move is searched until the end of the game
+def brute_force(game, depth):
+    if game.winner is not None:
+        return 0 if game.winner == DRAW else -WIN_SCORE + depth
+    best = -WIN_SCORE
+    for action in sorted(game.successors()):
+        game.apply_action(action)
+        best = max(best, -brute_force(game, depth + 1))
+        game.undo_action()
+    return best
+
+
+# Random games stopped EMPTY_CELLS cells before the end, the game goes on in every position
+def endgame_positions(n, seed):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < n:
+        game = Game()
+        while game.winner is None and len(game.actions) < N_CELLS - EMPTY_CELLS:
+            game.apply_action(rng.choice(sorted(game.successors())))
+        if game.winner is None:
+            positions.append(game.actions)
+    return positions
+
+
+def test_solver_matches_brute_force():
+    solver = Solver()
+    for actions in endgame_positions(20, seed=0):
+        game = Game.from_actions(actions)
+        score, action = solver.solve(game)
+        assert game.actions == actions
+        assert score == brute_force(game, 0)
+        # The move of the solver reaches its score
+        game.apply_action(action)
+        assert -brute_force(game, 1) == score